@@ -0,0 +1,114 @@
+from hashlib import sha256
+from time import time_ns
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from recipes.lru import LocalLRUCache
+
+local_cache = LocalLRUCache(
+    maxsize=settings.AUTH_TOKEN_LRU_SIZE, ttl=settings.AUTH_TOKEN_LRU_TTL)
+
+
+def token_key(key):
+    return f'auth-token:{sha256(key.encode()).hexdigest()}'
+
+
+def token_user_key(key):
+    return f'auth-token-user:{sha256(key.encode()).hexdigest()}'
+
+
+def generation_key(user_id):
+    return f'auth-generation:{user_id}'
+
+
+def forget_user(user_id):
+    """Сбрасывает закэшированные токены пользователя после коммита."""
+    def bump():
+        try:
+            cache.incr(generation_key(user_id))
+        except ValueError:
+            pass
+    transaction.on_commit(bump)
+
+
+def cached_fields(user):
+    """
+    Поля пользователя, которые можно хранить в кэше.
+
+    Хеш пароля в кэш не попадает, а счетчики меняются через update()
+    без смены поколения; при загрузке из кэша эти поля отложены.
+    """
+    excluded = {'password', *getattr(user, 'counter_fields', ())}
+    return [field for field in user._meta.concrete_fields
+            if field.name not in excluded]
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication, который помнит владельца токена.
+
+    В кэше процесса и в общем кэше по токену хранятся id пользователя,
+    его поколение и значения полей без пароля и счетчиков. Поколение
+    лежит в общем кэше и растет при сохранении пользователя или
+    удалении его токена, поэтому запись сразу перестает действовать
+    во всех процессах. Пока поколение совпадает, пользователь
+    собирается из кэша без запросов к базе: на запрос остается одно
+    обращение к общему кэшу.
+
+    Связь токена с пользователем не меняется и хранится отдельно
+    дольше записи: после сброса поколения на запрос уходит один запрос
+    к базе, как у обычного TokenAuthentication.
+    """
+
+    def authenticate_credentials(self, key):
+        cache_key = token_key(key)
+        for source in (local_cache, cache):
+            entry = source.get(cache_key)
+            if entry is None:
+                continue
+            user_id, generation, values = entry
+            if cache.get(generation_key(user_id)) == generation:
+                if source is cache:
+                    local_cache.set(cache_key, entry)
+                return self.build_credentials(key, values)
+        user_id = cache.get(token_user_key(key))
+        if user_id is None:
+            user_id = Token.objects.filter(key=key).values_list(
+                'user_id', flat=True).first()
+        # Поколение читается до проверки токена: если пользователь
+        # изменится после чтения, запись в кэше окажется устаревшей.
+        generation = self.get_generation(user_id) if user_id else None
+        user, token = super().authenticate_credentials(key)
+        if generation is not None and user.id == user_id:
+            entry = (user_id, generation, [
+                field.get_prep_value(field.value_from_object(user))
+                for field in cached_fields(user)
+            ])
+            cache.set(cache_key, entry,
+                      timeout=settings.AUTH_TOKEN_CACHE_TIMEOUT)
+            cache.set(token_user_key(key), user_id,
+                      timeout=settings.AUTH_TOKEN_USER_TIMEOUT)
+            local_cache.set(cache_key, entry)
+        return user, token
+
+    @staticmethod
+    def get_generation(user_id):
+        key = generation_key(user_id)
+        cache.add(key, time_ns(), timeout=None)
+        return cache.get(key)
+
+    @staticmethod
+    def build_credentials(key, values):
+        """Новый экземпляр пользователя и несохраняемый объект токена."""
+        model = get_user_model()
+        user = model.from_db(
+            DEFAULT_DB_ALIAS,
+            [field.attname for field in cached_fields(model)],
+            values,
+        )
+        return user, Token(key=key, user=user)
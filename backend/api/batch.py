@@ -0,0 +1,95 @@
+import logging
+from urllib.parse import urlsplit
+
+from django.http import HttpRequest, QueryDict
+from django.urls import Resolver404, resolve
+from rest_framework import status
+from rest_framework.response import Response
+
+from .cache import request_cache
+
+# Заголовки пакета, которые не должны попасть в подзапросы.
+DROPPED_META = frozenset((
+    'CONTENT_LENGTH',
+    'CONTENT_TYPE',
+    'HTTP_AUTHORIZATION',
+    'HTTP_IF_MODIFIED_SINCE',
+    'HTTP_IF_NONE_MATCH',
+    'wsgi.input',
+))
+FORWARDED_HEADERS = ('ETag', 'Last-Modified')
+# Файлы и постановка задач в очередь не подходят для пакета только
+# на чтение.
+EXCLUDED_URL_NAMES = frozenset(('recipes-download-shopping-cart',))
+
+logger = logging.getLogger(__name__)
+
+
+def build_subrequest(request, path):
+    """
+    Создает GET-подзапрос от имени уже аутентифицированного пользователя.
+
+    Пользователь передается через _force_auth_user, поэтому токен
+    повторно не проверяется, а кэш запроса общий для всего пакета.
+    """
+    url = urlsplit(path)
+    subrequest = HttpRequest()
+    subrequest.method = 'GET'
+    subrequest.path = subrequest.path_info = url.path
+    subrequest.META = {
+        key: value for key, value in request.META.items()
+        if key not in DROPPED_META
+    }
+    subrequest.META.update(
+        REQUEST_METHOD='GET',
+        PATH_INFO=url.path,
+        QUERY_STRING=url.query,
+        HTTP_ACCEPT='application/json',
+    )
+    subrequest.GET = QueryDict(url.query)
+    subrequest.COOKIES = request.COOKIES
+    if request.user.is_authenticated:
+        subrequest._force_auth_user = request.user
+        subrequest._force_auth_token = request.auth
+    subrequest.request_cache = request_cache(request)
+    return subrequest
+
+
+def error_response(path, status_code, detail):
+    return {
+        'path': path,
+        'status': status_code,
+        'headers': {},
+        'body': {'detail': detail},
+    }
+
+
+def dispatch_subrequest(request, path, urlconf):
+    subrequest = build_subrequest(request, path)
+    try:
+        match = resolve(subrequest.path_info, urlconf=urlconf)
+    except Resolver404:
+        return error_response(
+            path, status.HTTP_404_NOT_FOUND, 'Страница не найдена.')
+    if match.url_name in EXCLUDED_URL_NAMES:
+        return error_response(
+            path, status.HTTP_400_BAD_REQUEST,
+            'Запрос недоступен в пакете.')
+    subrequest.resolver_match = match
+    try:
+        response = match.func(subrequest, *match.args, **match.kwargs)
+    except Exception:
+        # Ошибка одного подзапроса не должна ронять весь пакет.
+        logger.exception('Подзапрос пакета %s завершился ошибкой.', path)
+        return error_response(
+            path, status.HTTP_500_INTERNAL_SERVER_ERROR,
+            'Внутренняя ошибка сервера.')
+    return {
+        'path': path,
+        'status': response.status_code,
+        'headers': {
+            header: response[header]
+            for header in FORWARDED_HEADERS if response.has_header(header)
+        },
+        'body': response.data if isinstance(response, Response) else None,
+    }
@@ -0,0 +1,138 @@
+from hashlib import md5
+from time import time_ns
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.http import urlencode
+
+RECIPE_LIST = 'recipe-list'
+RECIPE_SEARCH = 'recipe-search'
+TAGS = 'tags'
+
+
+def get_cache():
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def request_cache(request):
+    """Кэш на время запроса, общий для всех подзапросов пакета."""
+    request = getattr(request, '_request', request)
+    if not hasattr(request, 'request_cache'):
+        request.request_cache = {}
+    return request.request_cache
+
+
+def dependency_key(name):
+    return f'dependency:{name}'
+
+
+def response_key(request):
+    """Ключ ответа: путь, формат и упорядоченные параметры запроса."""
+    query = urlencode(sorted(
+        (key, value)
+        for key, values in request.query_params.lists()
+        for value in values
+    ))
+    digest = md5(query.encode(), usedforsecurity=False).hexdigest()
+    return (f'response:{request.accepted_renderer.format}:'
+            f'{request.path}:{digest}')
+
+
+def get_cached_response(request):
+    """Данные ответа из кэша, если ни одна зависимость не изменилась."""
+    cache = get_cache()
+    entry = cache.get(response_key(request))
+    if entry is None:
+        return None
+    data, versions = entry
+    current = cache.get_many(list(versions))
+    if any(current.get(key) != version for key, version in versions.items()):
+        return None
+    return data
+
+
+def dependency_versions(dependencies):
+    """
+    Текущие версии зависимостей, недостающие создаются.
+
+    Читается до построения ответа: изменение, закоммиченное во время
+    построения, поднимет версию позже, и сохраненный ответ устареет.
+    """
+    cache = get_cache()
+    keys = [dependency_key(name) for name in dependencies]
+    versions = cache.get_many(keys)
+    if len(versions) != len(keys):
+        for key in keys:
+            if key not in versions:
+                cache.add(key, time_ns(), timeout=None)
+        versions = cache.get_many(keys)
+    return versions
+
+
+def cache_response(request, data, dependencies, versions):
+    """
+    Сохраняет ответ с версиями зависимостей.
+
+    versions - версии, прочитанные до построения ответа. Версии
+    остальных зависимостей читаются сейчас; если какой-то еще не было,
+    она создается, а ответ не сохраняется: неизвестно, не изменился ли
+    объект, пока строился ответ.
+    """
+    cache = get_cache()
+    rest = {dependency_key(name): name for name in dependencies
+            if dependency_key(name) not in versions}
+    current = cache.get_many(list(rest))
+    if len(current) != len(rest):
+        dependency_versions(
+            name for key, name in rest.items() if key not in current)
+        return
+    cache.set(
+        response_key(request),
+        (data, {**current, **versions}),
+        timeout=settings.RESPONSE_CACHE_TIMEOUT
+    )
+
+
+def invalidate(*dependencies):
+    """Сбрасывает ответы, зависящие от объектов, после коммита."""
+    def bump():
+        cache = get_cache()
+        for name in dependencies:
+            try:
+                cache.incr(dependency_key(name))
+            except ValueError:
+                pass
+    transaction.on_commit(bump)
+
+
+def recipe_dependencies(recipe):
+    dependencies = {
+        f'recipe:{recipe["id"]}',
+        f'author:{recipe["author"]["id"]}',
+    }
+    dependencies.update(f'tag:{tag["id"]}' for tag in recipe['tags'])
+    dependencies.update(
+        f'ingredient:{ingredient["id"]}'
+        for ingredient in recipe['ingredients']
+    )
+    return dependencies
+
+
+def recipe_list_base_dependencies(request):
+    """Зависимости списка, известные до его построения."""
+    dependencies = {RECIPE_LIST}
+    if 'tags' in request.query_params:
+        dependencies.add(TAGS)
+    # Поиск и подбор по ингредиентам зависят от содержимого всех рецептов.
+    if ('search' in request.query_params
+            or 'ingredients' in request.query_params):
+        dependencies.add(RECIPE_SEARCH)
+    return dependencies
+
+
+def recipe_list_dependencies(request, data):
+    dependencies = recipe_list_base_dependencies(request)
+    for recipe in data['results']:
+        dependencies |= recipe_dependencies(recipe)
+    return dependencies
@@ -0,0 +1,101 @@
+from hashlib import md5
+
+from django.db.models import Exists, OuterRef, Subquery
+
+from .cache import request_cache
+from recipes.models import CatalogVersion, Recipe
+from users.models import Subscribe
+
+RECIPE_STATE_FIELDS = (
+    'updated_at',
+    'author__email',
+    'author__username',
+    'author__first_name',
+    'author__last_name',
+    'author__avatar',
+)
+
+
+def catalog_version_subquery(name):
+    return Subquery(CatalogVersion.objects.filter(name=name).values(
+        'version')[:1])
+
+
+def catalog_updated_subquery(name):
+    return Subquery(CatalogVersion.objects.filter(name=name).values(
+        'updated_at')[:1])
+
+
+def get_catalog_state(request, name):
+    states = request_cache(request).setdefault('catalog_states', {})
+    if name not in states:
+        states[name] = CatalogVersion.objects.filter(name=name).values(
+            'version', 'updated_at').first() or {
+                'version': 0, 'updated_at': None}
+    return states[name]
+
+
+def catalog_etag(name):
+    def etag(request, *args, **kwargs):
+        state = get_catalog_state(request, name)
+        return (f'{name}-{state["version"]}-'
+                f'{request.accepted_renderer.format}')
+    return etag
+
+
+def catalog_last_modified(name):
+    def last_modified(request, *args, **kwargs):
+        return get_catalog_state(request, name)['updated_at']
+    return last_modified
+
+
+def get_recipe_state(request, pk):
+    """Одним запросом читает все, от чего зависит ответ с рецептом."""
+    states = request_cache(request).setdefault('recipe_states', {})
+    if pk not in states:
+        recipes = Recipe.objects.filter(pk=pk).annotate(
+            tags_version=catalog_version_subquery(CatalogVersion.TAGS),
+            tags_updated_at=catalog_updated_subquery(CatalogVersion.TAGS),
+            ingredients_version=catalog_version_subquery(
+                CatalogVersion.INGREDIENTS),
+            ingredients_updated_at=catalog_updated_subquery(
+                CatalogVersion.INGREDIENTS),
+        )
+        fields = RECIPE_STATE_FIELDS + (
+            'tags_version', 'tags_updated_at',
+            'ingredients_version', 'ingredients_updated_at',
+        )
+        user = request.user
+        if user.is_authenticated:
+            recipes = recipes.annotate_user_recipe(user).annotate(
+                is_subscribed=Exists(Subscribe.objects.filter(
+                    user=user, author=OuterRef('author')))
+            )
+            fields += ('is_favorited', 'is_in_shopping_cart',
+                       'is_subscribed')
+        states[pk] = recipes.values(*fields).first()
+    return states[pk]
+
+
+def recipe_etag(request, pk, *args, **kwargs):
+    state = get_recipe_state(request, pk)
+    if state is None:
+        return None
+    fingerprint = md5(repr(sorted(state.items())).encode(),
+                      usedforsecurity=False).hexdigest()
+    return f'recipe-{pk}-{fingerprint}-{request.accepted_renderer.format}'
+
+
+def recipe_last_modified(request, pk, *args, **kwargs):
+    if request.user.is_authenticated:
+        return None
+    state = get_recipe_state(request, pk)
+    if state is None:
+        return None
+    return max(
+        moment for moment in (
+            state['updated_at'],
+            state['tags_updated_at'],
+            state['ingredients_updated_at'],
+        ) if moment is not None
+    )
@@ -0,0 +1,77 @@
+from django.core.exceptions import ValidationError
+from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS
+
+
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Первичный ключ, который в списке ищется одним запросом.
+
+    Список заранее передает все значения в prefetch(), после чего
+    отдельные значения берутся из найденных объектов без запросов.
+    Ошибки те же, что у PrimaryKeyRelatedField.
+    """
+
+    def __init__(self, **kwargs):
+        self.resolved = None
+        super().__init__(**kwargs)
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BulkManyRelatedField(**list_kwargs)
+
+    def to_key(self, value):
+        if isinstance(value, bool):
+            return None
+        if self.pk_field is not None:
+            value = self.pk_field.to_internal_value(value)
+        try:
+            return self.get_queryset().model._meta.pk.to_python(value)
+        except (TypeError, ValueError, ValidationError):
+            return None
+
+    def prefetch(self, values):
+        keys = set()
+        for value in values:
+            try:
+                key = self.to_key(value)
+            except serializers.ValidationError:
+                continue
+            if key is not None:
+                keys.add(key)
+        self.resolved = self.get_queryset().in_bulk(keys)
+
+    def to_internal_value(self, data):
+        if self.resolved is not None:
+            key = self.to_key(data)
+            if key in self.resolved:
+                return self.resolved[key]
+            if key is not None:
+                self.fail('does_not_exist', pk_value=data)
+        return super().to_internal_value(data)
+
+
+class BulkManyRelatedField(serializers.ManyRelatedField):
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            self.child_relation.prefetch(data)
+        return super().to_internal_value(data)
+
+
+class BulkRelatedListSerializer(serializers.ListSerializer):
+    """Список вложенных объектов, связи которых ищутся пакетно."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            for name, field in self.child.fields.items():
+                if (isinstance(field, BulkPrimaryKeyRelatedField)
+                        and not field.read_only):
+                    field.prefetch(
+                        item[name] for item in data
+                        if isinstance(item, dict) and name in item
+                    )
+        return super().to_internal_value(data)
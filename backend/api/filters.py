@@ -1,8 +1,14 @@
+from django.conf import settings
 from django_filters.rest_framework import filters, FilterSet
 
+from recipes.composition_index import MATCH_ALL, MATCH_ANY, composition_index
 from recipes.models import Ingredient, Recipe, Tag
 
 
+class NumberInFilter(filters.BaseInFilter, filters.NumberFilter):
+    pass
+
+
 class IngredientFilter(FilterSet):
     name = filters.CharFilter(field_name='name', lookup_expr='istartswith')
 
@@ -21,6 +27,15 @@ class RecipeFilter(FilterSet):
     is_favorited = filters.BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart')
+    search = filters.CharFilter(method='filter_search')
+    ingredients = NumberInFilter(method='filter_ingredients')
+    ingredients_match = filters.ChoiceFilter(
+        choices=((MATCH_ALL, 'Все ингредиенты'),
+                 (MATCH_ANY, 'Хотя бы один ингредиент')),
+        method='filter_ingredient_options',
+    )
+    max_missing = filters.NumberFilter(
+        min_value=0, method='filter_ingredient_options')
 
     class Meta:
         model = Recipe
@@ -37,3 +52,21 @@ class RecipeFilter(FilterSet):
         if value and not user.is_anonymous:
             return queryset.filter(carts__user=user)
         return queryset
+
+    def filter_search(self, queryset, name, value):
+        return queryset.search(value)
+
+    def filter_ingredients(self, queryset, name, value):
+        """Рецепты из имеющихся ингредиентов, сначала с большим покрытием."""
+        options = self.form.cleaned_data
+        max_missing = options.get('max_missing')
+        matches = composition_index.search(
+            (int(ingredient_id) for ingredient_id in value),
+            match=options.get('ingredients_match') or MATCH_ANY,
+            max_missing=None if max_missing is None else int(max_missing),
+            limit=settings.COMPOSITION_SEARCH_LIMIT,
+        )
+        return queryset.with_ingredient_matches(matches)
+
+    def filter_ingredient_options(self, queryset, name, value):
+        return queryset
@@ -1,6 +1,221 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import (BasePagination, PageNumberPagination,
+                                       _positive_int)
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def parse_cursor_datetime(value):
+    value = parse_datetime(value)
+    if value is None:
+        raise ValueError('Неверная дата.')
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value
+
+
+def parse_cursor_int(value):
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise TypeError('Неверное число.')
+    return int(value)
+
+
+class KeysetPagination(BasePagination):
+    """Пагинация по ключу сортировки без подсчета количества объектов.
+
+    Курсор хранит значения полей сортировки последнего объекта страницы,
+    поэтому стоимость запроса не зависит от номера страницы.
+    """
+
+    ordering = ('-pub_date', '-id')
+    # Разбор значений курсора, по одной функции на поле сортировки.
+    position_parsers = (parse_cursor_datetime, parse_cursor_int)
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    page_size = 6
+    max_page_size = settings.MAX_PAGE_SIZE
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+        queryset = queryset.order_by(*self.ordering)
+        if position is not None:
+            queryset = queryset.filter(self.position_filter(position))
+        results = list(queryset[:page_size + 1])
+        self.next_position = None
+        if len(results) > page_size:
+            results = results[:page_size]
+            self.next_position = self.get_position(results[-1])
+        return results
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True,
+                cutoff=self.max_page_size
+            )
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def get_position(self, obj):
+        values = []
+        for field in self.ordering:
+            value = getattr(obj, field.lstrip('-'))
+            if isinstance(value, datetime):
+                value = value.isoformat()
+            values.append(value)
+        return values
+
+    def position_filter(self, position, ordering=None):
+        condition, equal = Q(), {}
+        for field, value in zip(ordering or self.ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def encode_cursor(self, position):
+        return urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            position = json.loads(urlsafe_b64decode(cursor.encode()))
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if (not isinstance(position, list)
+                or len(position) != len(self.ordering)):
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            return [parse(value) for parse, value
+                    in zip(self.position_parsers, position)]
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(self.next_position)
+        )
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {
+                    'type': 'string',
+                    'nullable': True,
+                    'format': 'uri',
+                },
+                'results': schema,
+            },
+        }
+
+
+class SubscriptionKeysetPagination(KeysetPagination):
+    ordering = ('-subscription_id',)
+    position_parsers = (parse_cursor_int,)
+
+
+class FeedPagination(KeysetPagination):
+    """Пагинация ленты подписок по ключу.
+
+    Лента собирается из двух источников: готовых записей ленты и рецептов
+    популярных авторов, которые не раскладываются по лентам при записи.
+    Из каждого источника берется не больше страницы ключей, ключи
+    сливаются, и только затем загружаются рецепты страницы.
+    """
+
+    entry_ordering = ('-pub_date', '-recipe_id')
+
+    def paginate_feed(self, entries, recipes, queryset, request):
+        self.request = request
+        page_size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+        keys = set()
+        for source, ordering in ((entries, self.entry_ordering),
+                                 (recipes, self.ordering)):
+            source = source.order_by(*ordering)
+            if position is not None:
+                source = source.filter(
+                    self.position_filter(position, ordering))
+            keys.update(source.values_list(
+                *(field.lstrip('-') for field in ordering)
+            )[:page_size + 1])
+        keys = sorted(keys, reverse=True)
+        self.next_position = None
+        if len(keys) > page_size:
+            keys = keys[:page_size]
+            pub_date, pk = keys[-1]
+            self.next_position = [pub_date.isoformat(), pk]
+        recipes = queryset.in_bulk([pk for _, pk in keys])
+        return [recipes[pk] for _, pk in keys if pk in recipes]
 
 
 class LimitPageNumberPagination(PageNumberPagination):
     page_size_query_param = "limit"
     page_size = 6
+    max_page_size = settings.MAX_PAGE_SIZE
+
+
+class RecipePagination(LimitPageNumberPagination):
+    """Постраничная пагинация, ?pagination=cursor включает пагинацию
+    по ключу.
+
+    Фильтры из ranked_query_params сортируют по релевантности, а ключ
+    курсора - по дате, поэтому вместе с ними курсор не принимается.
+    """
+
+    keyset_class = KeysetPagination
+    mode_query_param = 'pagination'
+    keyset_mode = 'cursor'
+    ranked_query_params = ('search', 'ingredients')
+    ranked_keyset_message = ('Пагинация по курсору недоступна '
+                             'при поиске и подборе по ингредиентам.')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if (request.query_params.get(self.mode_query_param)
+                == self.keyset_mode
+                or self.keyset_class.cursor_query_param
+                in request.query_params):
+            if any(request.query_params.get(param)
+                   for param in self.ranked_query_params):
+                raise ValidationError(
+                    {self.mode_query_param: [self.ranked_keyset_message]})
+            self.keyset = self.keyset_class()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class SubscriptionPagination(RecipePagination):
+    keyset_class = SubscriptionKeysetPagination
+    ranked_query_params = ()
@@ -0,0 +1,76 @@
+import csv
+import json
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+
+class EchoBuffer:
+    """Буфер для csv.writer, возвращающий записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+class ShoppingListRenderer(BaseRenderer):
+    """Базовый формат выгрузки списка покупок.
+
+    Сам список отдается потоком через stream(), render() нужен только
+    для ответов с ошибками.
+    """
+
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return JSONRenderer().render(data)
+
+    def stream(self, rows):
+        raise NotImplementedError
+
+
+class TextShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, rows):
+        yield 'Список покупок\n\n'
+        separator = ''
+        for name, measurement_unit, amount in rows:
+            yield f'{separator}- {name} ({measurement_unit}) - {amount}'
+            separator = '\n'
+
+
+class CSVShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, rows):
+        writer = csv.writer(EchoBuffer())
+        yield writer.writerow(('name', 'measurement_unit', 'amount'))
+        for row in rows:
+            yield writer.writerow(row)
+
+
+class JSONShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'application/json'
+    format = 'json'
+
+    def stream(self, rows):
+        separator = '['
+        for name, measurement_unit, amount in rows:
+            yield separator + json.dumps(
+                {'name': name,
+                 'measurement_unit': measurement_unit,
+                 'amount': amount},
+                ensure_ascii=False,
+            )
+            separator = ','
+        yield ']' if separator == ',' else '[]'
+
+
+SHOPPING_LIST_RENDERERS = (
+    TextShoppingListRenderer,
+    CSVShoppingListRenderer,
+    JSONShoppingListRenderer,
+)
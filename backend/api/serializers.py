@@ -1,14 +1,44 @@
 from django.conf import settings
+from django.core.files.storage import default_storage
 from django.db import transaction
-from django.db.models import F
+from django.db.models import prefetch_related_objects
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 
-from recipes.models import (FavoriteRecipe, Ingredient, Recipe,
-                            RecipeIngredients, ShoppingCart, Tag)
+from .cache import request_cache
+from .fields import BulkPrimaryKeyRelatedField, BulkRelatedListSerializer
+from jobs.models import Job
+from recipes.composition_index import composition_index
+from recipes.models import (Ingredient, Recipe, RecipeIngredients,
+                            ShoppingCartIngredient, Tag, recipe_prefetches)
+from recipes.tasks import (make_recipe_renditions,
+                           refresh_recipe_similarities)
 from users.models import Subscribe, User
 
 
+def get_recipes_limit(request):
+    try:
+        limit = int(request.query_params['recipes_limit'])
+    except (AttributeError, KeyError, ValueError):
+        return None
+    return max(limit, 0)
+
+
+class ImageRenditionField(serializers.ReadOnlyField):
+    """Ссылка на копию изображения, до ее создания - на оригинал."""
+
+    def __init__(self, rendition, **kwargs):
+        self.rendition = rendition
+        super().__init__(source='*', **kwargs)
+
+    def to_representation(self, recipe):
+        path = recipe.image_renditions.get(self.rendition)
+        if path:
+            return default_storage.url(path)
+        if recipe.image:
+            return recipe.image.url
+
+
 class TagSerializer(serializers.ModelSerializer):
     class Meta:
         model = Tag
@@ -41,9 +71,17 @@ class UsersSerializer(serializers.ModelSerializer):
         read_only_fields = ('is_subscribed',)
 
     def get_is_subscribed(self, author):
+        if hasattr(author, 'is_subscribed'):
+            return author.is_subscribed
         request = self.context.get('request')
-        return (request and request.user.is_authenticated
-                and request.user.subscriber.filter(author=author).exists())
+        if not (request and request.user.is_authenticated):
+            return False
+        cache = request_cache(request)
+        if 'subscribed_authors' not in cache:
+            cache['subscribed_authors'] = set(
+                request.user.subscriber.values_list('author_id', flat=True)
+            )
+        return author.id in cache['subscribed_authors']
 
     def get_avatar(self, obj):
         if obj.avatar:
@@ -57,9 +95,14 @@ class SetAvatarSerializer(serializers.ModelSerializer):
         model = User
         fields = ('avatar',)
 
+    def update(self, instance, validated_data):
+        instance.avatar = validated_data['avatar']
+        instance.save(update_fields=('avatar',))
+        return instance
+
 
 class SubscribeViewSerializer(UsersSerializer):
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.IntegerField(read_only=True)
     recipes = serializers.SerializerMethodField()
 
     class Meta(UsersSerializer.Meta):
@@ -67,17 +110,14 @@ class SubscribeViewSerializer(UsersSerializer):
         read_only_fields = ('__all__',)
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        limit = request.GET.get('recipes_limit') if request else None
-        recipes = obj.recipes.all()
-        if limit:
-            recipes = recipes[:int(limit)]
+        recipes = getattr(obj, 'latest_recipes', None)
+        if recipes is None:
+            request = self.context.get('request')
+            recipes = Recipe.objects.latest_by_author(
+                (obj.id,), get_recipes_limit(request))[obj.id]
         serializer = RecipeShortSerializer(recipes, many=True, read_only=True)
         return serializer.data
 
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
-
 
 class SubscribeSerializer(serializers.ModelSerializer):
     class Meta:
@@ -99,21 +139,43 @@ class SubscribeSerializer(serializers.ModelSerializer):
 
 
 class RecipeShortSerializer(serializers.ModelSerializer):
+    image_card = ImageRenditionField('card')
+    image_webp = ImageRenditionField('webp')
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_card', 'image_webp',
+                  'cooking_time')
         read_only_fields = ('__all__',)
 
 
+class SimilarRecipeSerializer(RecipeShortSerializer):
+    score = serializers.FloatField(read_only=True)
+
+    class Meta(RecipeShortSerializer.Meta):
+        fields = (*RecipeShortSerializer.Meta.fields, 'score')
+
+
 class RecipeAddIngredientsSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all())
+    id = BulkPrimaryKeyRelatedField(queryset=Ingredient.objects.all())
     amount = serializers.IntegerField(
         min_value=1, max_value=settings.MAX_POSITIVE_INTEGER)
 
     class Meta:
         model = RecipeIngredients
         fields = ('id', 'amount',)
+        list_serializer_class = BulkRelatedListSerializer
+
+
+class RecipeIngredientsReadSerializer(serializers.ModelSerializer):
+    id = serializers.ReadOnlyField(source='ingredient.id')
+    name = serializers.ReadOnlyField(source='ingredient.name')
+    measurement_unit = serializers.ReadOnlyField(
+        source='ingredient.measurement_unit')
+
+    class Meta:
+        model = RecipeIngredients
+        fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
 class NotEmptyBase64ImageField(Base64ImageField):
@@ -126,24 +188,21 @@ class NotEmptyBase64ImageField(Base64ImageField):
 class RecipeReadSerializer(serializers.ModelSerializer):
     author = UsersSerializer(read_only=True)
     tags = TagSerializer(many=True, read_only=True)
-    ingredients = serializers.SerializerMethodField()
+    ingredients = RecipeIngredientsReadSerializer(
+        source='recipe_ingredients', many=True, read_only=True)
     is_favorited = serializers.BooleanField(default=False)
     is_in_shopping_cart = serializers.BooleanField(default=False)
     image = serializers.SerializerMethodField()
+    image_card = ImageRenditionField('card')
+    image_detail = ImageRenditionField('detail')
+    image_webp = ImageRenditionField('webp')
 
     class Meta:
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients',
                   'is_favorited', 'is_in_shopping_cart',
-                  'name', 'image', 'text', 'cooking_time')
-
-    def get_ingredients(self, obj):
-        return obj.ingredients.values(
-            'id',
-            'name',
-            'measurement_unit',
-            amount=F('recipeingredients__amount')
-        )
+                  'name', 'image', 'image_card', 'image_detail',
+                  'image_webp', 'text', 'cooking_time')
 
     def get_image(self, obj):
         if obj.image:
@@ -152,7 +211,7 @@ class RecipeReadSerializer(serializers.ModelSerializer):
 
 class RecipeWriteSerializer(serializers.ModelSerializer):
     ingredients = RecipeAddIngredientsSerializer(many=True, write_only=True)
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = BulkPrimaryKeyRelatedField(
         queryset=Tag.objects.all(),
         many=True)
     image = NotEmptyBase64ImageField()
@@ -165,7 +224,14 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
                   'name', 'text', 'cooking_time', 'author')
 
     def validate(self, data):
-        ingredients = data.get('ingredients')
+        if not self.partial or 'ingredients' in data:
+            self.validate_ingredients_list(data.get('ingredients'))
+        if not self.partial or 'tags' in data:
+            self.validate_tags_list(data.get('tags'))
+        return data
+
+    @staticmethod
+    def validate_ingredients_list(ingredients):
         if not ingredients:
             raise serializers.ValidationError(
                 {'ingredient': 'Нужно выбрать хотя бы один ингредиент!'}
@@ -175,7 +241,9 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 {'ingredient': 'Ингредиенты должны быть уникальными!'}
             )
-        tags = data.get('tags')
+
+    @staticmethod
+    def validate_tags_list(tags):
         if not tags:
             raise serializers.ValidationError({
                 'tags': 'Нужно выбрать хотя бы один таг!'
@@ -187,7 +255,6 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError({
                 'tags': f'Теги <{not_unique_tag}> не уникальны!'
             })
-        return data
 
     @staticmethod
     def create_ingredients_amounts(ingredients, recipe):
@@ -206,66 +273,119 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         recipe = Recipe.objects.create(**validated_data)
         recipe.tags.set(tags)
         self.create_ingredients_amounts(ingredients=ingredients, recipe=recipe)
+        make_recipe_renditions.enqueue((recipe.id,))
+        refresh_recipe_similarities.enqueue((recipe.id,))
         return recipe
 
+    @staticmethod
+    def update_ingredients_amounts(ingredients, recipe):
+        """
+        Меняет только отличающиеся строки состава рецепта.
+
+        Возвращает True, если изменился набор ингредиентов.
+        """
+        rows = {
+            row.ingredient_id: row
+            for row in RecipeIngredients.objects.filter(recipe=recipe)
+        }
+        old_amounts = {
+            ingredient_id: row.amount for ingredient_id, row in rows.items()}
+        new_amounts = {
+            item['id'].id: item['amount'] for item in ingredients}
+        removed = rows.keys() - new_amounts.keys()
+        if removed:
+            RecipeIngredients.objects.filter(
+                id__in=[rows[ingredient_id].id for ingredient_id in removed]
+            ).delete()
+        changed = []
+        for ingredient_id, row in rows.items():
+            amount = new_amounts.get(ingredient_id, row.amount)
+            if amount != row.amount:
+                row.amount = amount
+                changed.append(row)
+        RecipeIngredients.objects.bulk_update(changed, ('amount',))
+        RecipeIngredients.objects.bulk_create(
+            RecipeIngredients(
+                recipe=recipe, ingredient_id=ingredient_id, amount=amount)
+            for ingredient_id, amount in new_amounts.items()
+            if ingredient_id not in rows
+        )
+        ShoppingCartIngredient.objects.change_recipe(
+            recipe.id, old_amounts, new_amounts)
+        return rows.keys() != new_amounts.keys()
+
     @transaction.atomic
     def update(self, instance, validated_data):
-        tags = validated_data.pop('tags')
-        ingredients = validated_data.pop('ingredients')
-        instance.tags.clear()
-        instance.tags.set(tags)
-        instance.ingredients.clear()
-        self.create_ingredients_amounts(
-            ingredients=ingredients, recipe=instance)
-        return super().update(instance, validated_data)
+        tags = validated_data.pop('tags', None)
+        ingredients = validated_data.pop('ingredients', None)
+        composition_changed = tags is not None
+        if tags is not None:
+            instance.tags.set(tags)
+        if ingredients is not None and self.update_ingredients_amounts(
+                ingredients, instance):
+            composition_changed = True
+            composition_index.recipes_changed((instance.id,))
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        instance.save(update_fields=(*validated_data, 'updated_at'))
+        if 'image' in validated_data:
+            make_recipe_renditions.enqueue((instance.id,))
+        if composition_changed:
+            refresh_recipe_similarities.enqueue((instance.id,))
+        return instance
 
     def to_representation(self, instance):
+        prefetch_related_objects([instance], *recipe_prefetches())
         return RecipeReadSerializer(
             instance, context={'request': self.context.get('request')}
         ).data
 
 
-class FavoriteRecipeSerializer(serializers.ModelSerializer):
+class JobSerializer(serializers.ModelSerializer):
     class Meta:
-        model = FavoriteRecipe
-        fields = ('user', 'recipe')
+        model = Job
+        fields = ('id', 'name', 'status', 'attempts', 'result', 'error',
+                  'created_at', 'finished_at')
+        read_only_fields = fields
+
+
+class ShoppingCartBulkSerializer(serializers.Serializer):
+    add = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        max_length=settings.SHOPPING_CART_BULK_LIMIT,
+        required=False,
+    )
+    remove = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        max_length=settings.SHOPPING_CART_BULK_LIMIT,
+        required=False,
+    )
 
     def validate(self, data):
-        if self.context.get('request').method == 'POST':
-            recipe = self.initial_data.get('recipe')
-            user = self.context.get('request').user
-            if user.favorites.filter(recipe=recipe).exists():
-                raise serializers.ValidationError(
-                    {'recipe': 'Рецепт уже добавлен в избранное.'}
-                )
-            return data
-        recipe = data.get('recipe')
-        user = data.get('user')
-        if not user.favorites.filter(recipe=recipe).exists():
+        if not data.get('add') and not data.get('remove'):
             raise serializers.ValidationError(
-                {'recipe': 'Рецепта нет в избранном.'}
-            )
+                'Нужно передать рецепты для добавления или удаления.')
+        if set(data.get('add', ())) & set(data.get('remove', ())):
+            raise serializers.ValidationError(
+                'Рецепт нельзя одновременно добавить и удалить.')
         return data
 
 
-class ShoppingCartSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = ShoppingCart
-        fields = ('user', 'recipe')
-
-    def validate(self, data):
-        if self.context.get('request').method == 'POST':
-            recipe = self.initial_data.get('recipe')
-            user = self.context.get('request').user
-            if user.carts.filter(recipe=recipe).exists():
-                raise serializers.ValidationError(
-                    {'recipe': 'Рецепт уже добавлен в список покупок.'}
-                )
-            return data
-        recipe = data.get('recipe')
-        user = data.get('user')
-        if not user.carts.filter(recipe=recipe).exists():
-            raise serializers.ValidationError(
-                {'recipe': 'Рецепта нет в списке покупок.'}
-            )
-        return data
+class BatchItemSerializer(serializers.Serializer):
+    method = serializers.ChoiceField(choices=('GET',), default='GET')
+    path = serializers.RegexField(
+        r'^/api/', max_length=2048,
+        error_messages={'invalid': 'Путь должен начинаться с /api/.'},
+    )
+
+
+class BatchSerializer(serializers.Serializer):
+    requests = serializers.ListField(
+        child=BatchItemSerializer(),
+        min_length=1,
+        max_length=settings.BATCH_MAX_REQUESTS,
+        error_messages={
+            'min_length': 'Нужен хотя бы один запрос.',
+            'max_length': 'Не больше {max_length} запросов в пакете.',
+        },
+    )
@@ -0,0 +1,81 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import forget_user
+from .cache import RECIPE_LIST, RECIPE_SEARCH, TAGS, invalidate
+from recipes.models import Ingredient, Recipe, RecipeIngredients, Tag
+from recipes.signals import recipes_imported, renditions_updated
+from users.models import User
+
+AUTHOR_FIELDS = frozenset(
+    ('email', 'username', 'first_name', 'last_name', 'avatar'))
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, created, **kwargs):
+    if created:
+        invalidate(f'recipe:{instance.id}', RECIPE_LIST, RECIPE_SEARCH)
+    else:
+        invalidate(f'recipe:{instance.id}', RECIPE_SEARCH)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    invalidate(f'recipe:{instance.id}', RECIPE_LIST, RECIPE_SEARCH)
+
+
+@receiver(recipes_imported)
+def recipes_loaded(sender, recipes, **kwargs):
+    invalidate(RECIPE_LIST, RECIPE_SEARCH)
+
+
+@receiver(renditions_updated)
+def recipe_renditions_updated(sender, recipe_ids, **kwargs):
+    invalidate(*(f'recipe:{recipe_id}' for recipe_id in recipe_ids))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, **kwargs):
+    if action.startswith('post_'):
+        invalidate(f'recipe:{instance.id}', RECIPE_LIST)
+
+
+@receiver(post_save, sender=RecipeIngredients)
+@receiver(post_delete, sender=RecipeIngredients)
+def recipe_ingredients_changed(sender, instance, **kwargs):
+    invalidate(f'recipe:{instance.recipe_id}')
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tag_changed(sender, instance, **kwargs):
+    invalidate(f'tag:{instance.id}', TAGS)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredient_changed(sender, instance, **kwargs):
+    invalidate(f'ingredient:{instance.id}')
+
+
+@receiver(post_save, sender=User)
+def author_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or AUTHOR_FIELDS.intersection(update_fields):
+        invalidate(f'author:{instance.id}')
+
+
+@receiver(post_delete, sender=User)
+def author_deleted(sender, instance, **kwargs):
+    invalidate(f'author:{instance.id}', RECIPE_LIST)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    forget_user(instance.id)
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    forget_user(instance.user_id)
@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from jobs.queue import task
+from recipes.models import ShoppingCartIngredient
+from .renderers import SHOPPING_LIST_RENDERERS
+
+RENDERERS = {renderer.format: renderer for renderer in SHOPPING_LIST_RENDERERS}
+
+
+@task
+def export_shopping_list(user_id, file_format):
+    """Сохраняет список покупок в файл, одинаковые списки - в один."""
+    ingredients = ShoppingCartIngredient.objects.filter(user_id=user_id)
+    digest = ingredients.digest()
+    if digest is None:
+        return None
+    renderer = RENDERERS[file_format]()
+    path = f'{settings.SHOPPING_LIST_EXPORT_PATH}{digest}.{file_format}'
+    if not default_storage.exists(path):
+        rows = ingredients.values_list(
+            'ingredient__name', 'ingredient__measurement_unit', 'amount'
+        ).order_by('ingredient__name').iterator(
+            chunk_size=settings.SHOPPING_LIST_CHUNK_SIZE)
+        content = ''.join(renderer.stream(rows)).encode(renderer.charset)
+        path = default_storage.save(path, ContentFile(content))
+    return {'url': default_storage.url(path), 'format': file_format}
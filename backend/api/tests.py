@@ -0,0 +1,728 @@
+import json
+from base64 import b64encode
+from contextlib import ExitStack
+from io import StringIO
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management import call_command
+from django.db import (DEFAULT_DB_ALIAS, DatabaseError, connection,
+                       connections, models)
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from .authentication import local_cache, token_key
+from recipes.composition_index import CompositionIndex, composition_index
+from recipes.ingredient_index import ingredient_index
+from recipes.links import get_short_code, recipe_key
+from recipes.links import local_cache as links_cache
+from recipes.models import (CatalogVersion, FeedEntry, Ingredient, Recipe,
+                            RecipeIngredients, RecipeSimilarity, Tag)
+from users.counters import change_counter
+from users.models import Subscribe, User
+
+WRITES = ('INSERT', 'UPDATE', 'DELETE')
+
+
+def create_user(name):
+    return User.objects.create_user(
+        email=f'{name}@example.com', username=name,
+        first_name='Имя', last_name='Фамилия', password='password')
+
+
+def create_recipe(author, name='Рецепт'):
+    return Recipe.objects.create(
+        author=author, name=name, text='Описание',
+        image='recipes/images/test.png', cooking_time=10)
+
+
+def writes(context, table=None):
+    """Запросы на запись из контекста, при необходимости в одну таблицу."""
+    return [
+        query['sql'] for query in context.captured_queries
+        if query['sql'].startswith(WRITES)
+        and (table is None or f'"{table}"' in query['sql'])
+    ]
+
+
+class RecipeUpdateTests(TestCase):
+    """PATCH рецепта пишет только то, что изменилось."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Имя', last_name='Фамилия', password='password')
+        cls.tags = Tag.objects.order_by('id')[:2]
+        cls.ingredients = Ingredient.objects.order_by('id')[:3]
+        cls.recipe = Recipe.objects.create(
+            author=cls.user, name='Рецепт', text='Описание',
+            image='recipes/images/test.png', cooking_time=10)
+        cls.recipe.tags.set(cls.tags)
+        RecipeIngredients.objects.bulk_create(
+            RecipeIngredients(recipe=cls.recipe, ingredient=ingredient,
+                              amount=10)
+            for ingredient in cls.ingredients)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f'/api/recipes/{self.recipe.id}/'
+
+    def patch(self, data):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.patch(self.url, data, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return context
+
+    def test_text_only_patch_issues_one_update(self):
+        context = self.patch({'text': 'Новое описание'})
+        self.assertEqual(len(writes(context)), 1)
+        self.assertTrue(writes(context, 'recipes_recipe')[0].startswith(
+            'UPDATE'))
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.text, 'Новое описание')
+
+    def test_amount_change_issues_one_bulk_update(self):
+        ingredients = [
+            {'id': ingredient.id, 'amount': 10}
+            for ingredient in self.ingredients
+        ]
+        ingredients[0]['amount'] = 20
+        ingredients[1]['amount'] = 30
+        context = self.patch({'ingredients': ingredients})
+        through = writes(context, 'recipes_recipeingredients')
+        self.assertEqual(len(through), 1)
+        self.assertTrue(through[0].startswith('UPDATE'))
+        self.assertEqual(
+            sorted(RecipeIngredients.objects.filter(
+                recipe=self.recipe).values_list('amount', flat=True)),
+            [10, 20, 30])
+
+    def test_omitted_relations_are_not_written(self):
+        context = self.patch({'name': 'Другое название'})
+        self.assertEqual(writes(context, 'recipes_recipeingredients'), [])
+        self.assertEqual(writes(context, 'recipes_recipe_tags'), [])
+        self.assertEqual(self.recipe.tags.count(), 2)
+        self.assertEqual(self.recipe.recipe_ingredients.count(), 3)
+
+
+class UserCountersTests(TestCase):
+    """Полное сохранение пользователя не затирает счетчики."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='user@example.com', username='user',
+            first_name='Имя', last_name='Фамилия', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_set_password_keeps_counters(self):
+        users = User.objects.filter(id=self.user.id)
+        change_counter(users, 'recipes_count', 2)
+        change_counter(users, 'subscribers_count', 3)
+        response = self.client.post('/api/users/set_password/', {
+            'current_password': 'password',
+            'new_password': 'Ne3w-password',
+        }, format='json')
+        self.assertEqual(response.status_code, 204, response.content)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('Ne3w-password'))
+        self.assertEqual(self.user.recipes_count, 2)
+        self.assertEqual(self.user.subscribers_count, 3)
+
+    def test_save_of_deleted_row_inserts_it(self):
+        User.objects.filter(id=self.user.id).delete()
+        self.user.first_name = 'Другое'
+        self.user.save()
+        self.assertEqual(
+            User.objects.get(id=self.user.id).first_name, 'Другое')
+
+    def test_save_keeps_deferred_fields(self):
+        change_counter(
+            User.objects.filter(id=self.user.id), 'recipes_count', 2)
+        user = User.objects.only('id', 'first_name').get(id=self.user.id)
+        user.first_name = 'Другое'
+        with CaptureQueriesContext(connection) as context:
+            user.save()
+        self.assertEqual(len(context.captured_queries), 1)
+        update = writes(context, 'users_user')[0]
+        self.assertIn('"first_name"', update)
+        self.assertNotIn('"password"', update)
+        self.assertNotIn('"recipes_count"', update)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.first_name, 'Другое')
+        self.assertEqual(self.user.recipes_count, 2)
+
+    def test_explicit_update_fields_write_counters(self):
+        self.user.recipes_count = 5
+        self.user.save(update_fields=('recipes_count',))
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.recipes_count, 5)
+
+
+class TokenAuthenticationCacheTests(TestCase):
+    """Закэшированный токен работает без запросов и сбрасывается вовремя."""
+
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        self.user = User.objects.create_user(
+            email='token@example.com', username='token',
+            first_name='Имя', last_name='Фамилия', password='password')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.assertEqual(self.me().status_code, 200)
+
+    def me(self):
+        return self.client.get('/api/users/me/')
+
+    def test_warm_cache_skips_user_and_token_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.me()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['email'], self.user.email)
+        self.assertFalse([
+            query for query in context.captured_queries
+            if 'FROM "users_user"' in query['sql']
+            or 'FROM "authtoken_token"' in query['sql']
+        ])
+
+    def test_cache_entry_has_no_password(self):
+        entry = cache.get(token_key(self.token.key))
+        self.assertIsNotNone(entry)
+        self.assertNotIn(self.user.password, entry[2])
+
+    def test_logout_invalidates_cached_token(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/auth/token/logout/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.me().status_code, 401)
+
+    def test_token_deletion_invalidates_cached_token(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.token.delete()
+        self.assertEqual(self.me().status_code, 401)
+
+    def test_deactivation_invalidates_cached_token(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self.me().status_code, 401)
+
+    def test_user_change_is_visible(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.first_name = 'Другое'
+            self.user.save()
+        self.assertEqual(self.me().data['first_name'], 'Другое')
+
+
+@override_settings(FEED_FANOUT_MAX_SUBSCRIBERS=1, JOBS_EAGER=True)
+class FeedTests(TestCase):
+    """
+    Лента подписок из записей ленты и рецептов популярных авторов.
+
+    Порог раскладки снижен до одного подписчика: автор с двумя
+    подписчиками считается популярным.
+    """
+
+    def setUp(self):
+        self.reader = create_user('reader')
+        self.other = create_user('other')
+        self.author = create_user('author')
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def subscribe(self, user, author):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Subscribe.objects.create(user=user, author=author)
+
+    def feed_ids(self, limit=10):
+        """id рецептов ленты, пройденной по всем страницам."""
+        ids, url = [], f'/api/recipes/feed/?limit={limit}'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, response.content)
+            ids += [recipe['id'] for recipe in response.data['results']]
+            url = response.data['next']
+        return ids
+
+    def entries(self, user):
+        return set(FeedEntry.objects.filter(user=user).values_list(
+            'recipe_id', flat=True))
+
+    def test_recipe_is_fanned_out_on_create(self):
+        self.subscribe(self.reader, self.author)
+        recipe = create_recipe(self.author)
+        self.assertEqual(self.entries(self.reader), {recipe.id})
+        self.assertEqual(self.feed_ids(), [recipe.id])
+
+    def test_popular_author_is_merged_on_read(self):
+        self.subscribe(self.reader, self.author)
+        self.subscribe(self.other, self.author)
+        recipes = [create_recipe(self.author, f'Рецепт {number}')
+                   for number in range(3)]
+        self.assertEqual(self.entries(self.reader), set())
+        self.assertEqual(self.feed_ids(),
+                         [recipe.id for recipe in reversed(recipes)])
+
+    def test_feed_is_backfilled_when_author_drops_under_threshold(self):
+        self.subscribe(self.reader, self.author)
+        subscription = self.subscribe(self.other, self.author)
+        recipes = [create_recipe(self.author, f'Рецепт {number}')
+                   for number in range(3)]
+        with self.captureOnCommitCallbacks(execute=True):
+            subscription.delete()
+        self.assertEqual(self.entries(self.reader),
+                         {recipe.id for recipe in recipes})
+        self.assertEqual(self.feed_ids(),
+                         [recipe.id for recipe in reversed(recipes)])
+
+    def test_unsubscribe_trims_feed(self):
+        subscription = self.subscribe(self.reader, self.author)
+        create_recipe(self.author)
+        subscription.delete()
+        self.assertEqual(self.entries(self.reader), set())
+        self.assertEqual(self.feed_ids(), [])
+
+    def test_cursor_pages_merge_both_sources(self):
+        popular = create_user('popular')
+        self.subscribe(self.reader, self.author)
+        self.subscribe(self.reader, popular)
+        self.subscribe(self.other, popular)
+        recipes = [
+            create_recipe(author, f'Рецепт {number}')
+            for number, author in enumerate(
+                (self.author, popular) * 3 + (self.author,))
+        ]
+        self.assertEqual(len(self.entries(self.reader)), 4)
+        expected = [recipe.id for recipe in reversed(recipes)]
+        for limit in (1, 2, 3):
+            with self.subTest(limit=limit):
+                self.assertEqual(self.feed_ids(limit), expected)
+
+
+@override_settings(SIMILAR_RECIPES_TAG_BONUS=0.1, JOBS_EAGER=True)
+class SimilarRecipesTests(TestCase):
+    """Похожие рецепты: Жаккар по ингредиентам и бонус за общие теги."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.ingredients = list(Ingredient.objects.order_by('id')[:4])
+        cls.tags = list(Tag.objects.order_by('id')[:2])
+        first, second, third, fourth = cls.ingredients
+        cls.base = cls.create(
+            'Основа', (first, second, third), cls.tags[:1])
+        cls.near = cls.create(
+            'Близкий', (first, second, third, fourth), cls.tags[:1])
+        cls.far = cls.create('Дальний', (first,), cls.tags[1:])
+        cls.unrelated = cls.create('Другой', (fourth,), cls.tags[:1])
+
+    @classmethod
+    def create(cls, name, ingredients, tags):
+        recipe = create_recipe(cls.author, name)
+        RecipeIngredients.objects.bulk_create(
+            RecipeIngredients(recipe=recipe, ingredient=ingredient, amount=1)
+            for ingredient in ingredients)
+        recipe.tags.set(tags)
+        return recipe
+
+    def setUp(self):
+        call_command('build_similar_recipes', stdout=StringIO())
+        self.client = APIClient()
+
+    def similar(self, recipe):
+        response = self.client.get(f'/api/recipes/{recipe.id}/similar/')
+        self.assertEqual(response.status_code, 200, response.content)
+        return [(item['id'], item['score']) for item in response.data]
+
+    def pairs(self):
+        return set(RecipeSimilarity.objects.values_list(
+            'recipe_id', 'similar_id', 'score'))
+
+    def test_scores_and_ordering(self):
+        similar = self.similar(self.base)
+        self.assertEqual([recipe_id for recipe_id, _ in similar],
+                         [self.near.id, self.far.id])
+        self.assertAlmostEqual(similar[0][1], 3 / 4 + 0.1)
+        self.assertAlmostEqual(similar[1][1], 1 / 3)
+
+    def test_recipe_is_not_similar_to_itself(self):
+        self.assertFalse(RecipeSimilarity.objects.filter(
+            recipe_id=models.F('similar_id')).exists())
+        for recipe in (self.base, self.near, self.far, self.unrelated):
+            self.assertNotIn(
+                recipe.id,
+                [recipe_id for recipe_id, _ in self.similar(recipe)])
+
+    def test_ingredients_change_refreshes_similarities(self):
+        client = APIClient()
+        client.force_authenticate(self.author)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.patch(
+                f'/api/recipes/{self.far.id}/',
+                {'ingredients': [{'id': ingredient.id, 'amount': 1}
+                                 for ingredient in self.ingredients[:3]],
+                 'tags': [self.tags[0].id]},
+                format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        similar = self.similar(self.base)
+        self.assertEqual(similar[0][0], self.far.id)
+        self.assertAlmostEqual(similar[0][1], 1 + 0.1)
+        refreshed = self.pairs()
+        call_command('build_similar_recipes', stdout=StringIO())
+        self.assertEqual(refreshed, self.pairs())
+
+
+class CompositionSearchTests(TestCase):
+    """Подбор рецептов по имеющимся ингредиентам."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = author = create_user('author')
+        cls.ingredients = list(Ingredient.objects.order_by('id')[:4])
+        first, second, third, fourth = cls.ingredients
+        cls.recipes = []
+        for number, ingredients in enumerate((
+            (first, second),
+            (first, second, third),
+            (third, fourth),
+            (fourth,),
+        )):
+            recipe = create_recipe(author, f'Рецепт {number}')
+            RecipeIngredients.objects.bulk_create(
+                RecipeIngredients(recipe=recipe, ingredient=ingredient,
+                                  amount=1)
+                for ingredient in ingredients)
+            cls.recipes.append(recipe)
+
+    def setUp(self):
+        cache.clear()
+        composition_index.invalidate()
+        self.client = APIClient()
+
+    def search(self, ingredients, **params):
+        response = self.client.get('/api/recipes/', {
+            'ingredients': ','.join(
+                str(self.ingredients[index].id) for index in ingredients),
+            **params,
+        })
+        self.assertEqual(response.status_code, 200, response.content)
+        return [self.recipes.index(Recipe(id=recipe['id']))
+                for recipe in response.data['results']]
+
+    def test_any_orders_by_matches_then_missing(self):
+        self.assertEqual(self.search((0, 2)), [1, 2, 0])
+        self.assertEqual(
+            self.search((0, 2), ingredients_match='any'), [1, 2, 0])
+
+    def test_all_requires_every_ingredient(self):
+        self.assertEqual(
+            self.search((0, 2), ingredients_match='all'), [1])
+        self.assertEqual(
+            self.search((0, 1), ingredients_match='all'), [0, 1])
+
+    def test_max_missing_limits_absent_ingredients(self):
+        self.assertEqual(
+            self.search((0, 1, 2), max_missing=0), [1, 0])
+        self.assertEqual(
+            self.search((0, 1, 2), max_missing=1), [1, 0, 2])
+
+    def test_ingredients_patch_updates_index(self):
+        self.assertEqual(self.search((3,), ingredients_match='all'), [3, 2])
+        self.client.force_authenticate(self.author)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                f'/api/recipes/{self.recipes[0].id}/',
+                {'ingredients': [
+                    {'id': self.ingredients[3].id, 'amount': 1}]},
+                format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(
+            self.search((3,), ingredients_match='all'), [3, 0, 2])
+
+    def test_other_process_sees_changes_without_shared_cache(self):
+        other = CompositionIndex(ttl=60, max_changes=100)
+        # Кэш в памяти другого процесса: чужих списков изменений в нем нет.
+        with mock.patch('recipes.composition_index.cache',
+                        LocMemCache('other-process', {})):
+            self.assertEqual(
+                [row[0] for row in other.search(
+                    (self.ingredients[3].id,), match='all')],
+                [self.recipes[3].id, self.recipes[2].id])
+            RecipeIngredients.objects.create(
+                recipe=self.recipes[0], ingredient=self.ingredients[3],
+                amount=1)
+        with mock.patch('recipes.composition_index.cache',
+                        LocMemCache('other-process', {})):
+            self.assertEqual(
+                [row[0] for row in other.search(
+                    (self.ingredients[3].id,), match='all')],
+                [self.recipes[3].id, self.recipes[2].id, self.recipes[0].id])
+
+
+class RecipeCursorPaginationTests(TestCase):
+    """Курсор не смешивается с сортировкой по релевантности."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = create_user('author')
+        cls.recipes = [create_recipe(author, f'Суп {number}')
+                       for number in range(3)]
+        cls.ingredient = Ingredient.objects.order_by('id').first()
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_cursor_pages_by_date(self):
+        response = self.client.get(
+            '/api/recipes/', {'pagination': 'cursor', 'limit': 2})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            [recipe.id for recipe in self.recipes[:0:-1]])
+        response = self.client.get(response.data['next'])
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            [self.recipes[0].id])
+        self.assertIsNone(response.data['next'])
+
+    def test_ranked_filters_reject_cursor(self):
+        for params in ({'search': 'суп'},
+                       {'ingredients': self.ingredient.id}):
+            for mode in ({'pagination': 'cursor'}, {'cursor': 'x'}):
+                with self.subTest(**params, **mode):
+                    response = self.client.get(
+                        '/api/recipes/', {**params, **mode})
+                    self.assertEqual(response.status_code, 400)
+                    self.assertIn('pagination', response.data)
+
+    def test_ranked_filters_use_page_numbers(self):
+        response = self.client.get('/api/recipes/', {'search': 'суп'})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.data['count'], 3)
+
+
+class IngredientSearchTests(TestCase):
+    """Поиск ингредиентов по названию из индекса в памяти процесса."""
+
+    def setUp(self):
+        ingredient_index.invalidate()
+
+    def search(self, name):
+        response = APIClient().get('/api/ingredients/', {'name': name})
+        self.assertEqual(response.status_code, 200)
+        return [item['name'] for item in response.data]
+
+    def test_prefix_matches_go_first_without_repeats(self):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit='г')
+            for name in ('zzyx', 'zzyx zzyx', 'azzyx'))
+        CatalogVersion.objects.bump(CatalogVersion.INGREDIENTS)
+        self.assertEqual(self.search('zzyx'), ['zzyx', 'zzyx zzyx', 'azzyx'])
+
+    def test_catalog_change_from_other_process_is_visible(self):
+        self.assertEqual(self.search('qqwx'), [])
+        # Так справочник пополняет load_catalog из отдельного процесса:
+        # bulk_create без сигналов и новая версия справочника.
+        Ingredient.objects.bulk_create(
+            [Ingredient(name='qqwx', measurement_unit='г')])
+        CatalogVersion.objects.bump(CatalogVersion.INGREDIENTS)
+        self.assertEqual(self.search('qqwx'), ['qqwx'])
+
+
+class ShortLinkCacheTests(TestCase):
+    """Записи о коротких ссылках сбрасываются только после коммита."""
+
+    def setUp(self):
+        cache.clear()
+        links_cache.clear()
+        self.recipe = create_recipe(create_user('author'))
+
+    def test_delete_forgets_link_after_commit(self):
+        recipe_id = self.recipe.id
+        code = get_short_code(recipe_id)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.recipe.delete()
+        self.assertEqual(cache.get(recipe_key(recipe_id)), code)
+        for callback in callbacks:
+            callback()
+        self.assertIsNone(cache.get(recipe_key(recipe_id)))
+        self.assertIsNone(get_short_code(recipe_id))
+
+    def test_missing_recipe_is_forgotten_when_created(self):
+        next_id = self.recipe.id + 1
+        self.assertIsNone(get_short_code(next_id))
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = create_recipe(self.recipe.author)
+        self.assertEqual(recipe.id, next_id)
+        self.assertIsNotNone(get_short_code(next_id))
+
+
+class ImportRecipesTests(TestCase):
+    """Импорт не оставляет файлов пропущенных строк и откаченных пакетов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('importer')
+        cls.tag = Tag.objects.order_by('id').first()
+        cls.ingredient = Ingredient.objects.order_by('id').first()
+
+    def setUp(self):
+        media_root = TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.media = Path(media_root.name)
+        media_settings = override_settings(MEDIA_ROOT=media_root.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+    def row(self, name, **extra):
+        return {
+            'author': self.user.email, 'name': name, 'text': 'Описание',
+            'cooking_time': 10, 'image': 'recipe.png',
+            'image_data': b64encode(b'image').decode(),
+            'tags': [self.tag.slug],
+            'ingredients': [{
+                'name': self.ingredient.name,
+                'measurement_unit': self.ingredient.measurement_unit,
+                'amount': 5,
+            }],
+            **extra,
+        }
+
+    def run_import(self, *rows):
+        path = self.media / 'import.ndjson'
+        path.write_text(
+            '\n'.join(json.dumps(row, ensure_ascii=False) for row in rows),
+            encoding='utf-8')
+        call_command('import_recipes', str(path),
+                     stdout=StringIO(), stderr=StringIO())
+
+    def images(self):
+        return list((self.media / 'recipes' / 'images').glob('*'))
+
+    def test_saves_images_of_imported_rows(self):
+        self.run_import(self.row('Рецепт'))
+
+        recipe = Recipe.objects.get(name='Рецепт')
+        self.assertEqual(
+            [path.name for path in self.images()],
+            [recipe.image.name.rsplit('/', 1)[1]])
+
+    def test_skipped_row_leaves_no_file(self):
+        self.run_import(self.row('Рецепт', pub_date='2024-13-40T00:00:00'))
+
+        self.assertFalse(Recipe.objects.filter(name='Рецепт').exists())
+        self.assertEqual(self.images(), [])
+
+    def test_failed_batch_deletes_saved_images(self):
+        with mock.patch(
+                'recipes.management.commands.import_recipes.'
+                'update_search_index', side_effect=DatabaseError('сбой')):
+            with self.assertRaises(DatabaseError):
+                self.run_import(self.row('Первый'), self.row('Второй'))
+
+        self.assertFalse(
+            Recipe.objects.filter(name__in=('Первый', 'Второй')).exists())
+        self.assertEqual(self.images(), [])
+
+
+@override_settings(DATABASE_REPLICAS=['replica_test'])
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    Чтение безопасных запросов идет на реплику, запись - в основную.
+
+    Реплика в тестах - зеркало основной базы, но другое соединение:
+    данные должны быть закоммичены, поэтому TransactionTestCase.
+    """
+
+    databases = {DEFAULT_DB_ALIAS, 'replica_test'}
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='reader@example.com', username='reader',
+            first_name='Имя', last_name='Фамилия', password='password')
+        self.token = Token.objects.create(user=self.user)
+        self.recipe = Recipe.objects.create(
+            author=self.user, name='Рецепт', text='Описание',
+            image='recipes/images/test.png', cooking_time=10)
+        cache.clear()
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def request(self, method, url, data=None):
+        """Ответ и запросы к репликам и к основной базе."""
+        with ExitStack() as stack:
+            replicas = [
+                stack.enter_context(CaptureQueriesContext(connections[alias]))
+                for alias in settings.DATABASE_REPLICAS
+            ]
+            primary = stack.enter_context(CaptureQueriesContext(connection))
+            response = getattr(self.client, method)(url, data, format='json')
+        return (
+            response,
+            [query for replica in replicas
+             for query in replica.captured_queries],
+            primary.captured_queries,
+        )
+
+    def test_get_reads_from_replica(self):
+        response, replica, _ = self.request('get', '/api/tags/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(replica)
+        self.assertNotIn(settings.REPLICA_STICKY_COOKIE, response.cookies)
+
+    def test_unsafe_methods_use_primary(self):
+        url = f'/api/recipes/{self.recipe.id}/'
+        for method in ('post', 'put'):
+            with self.subTest(method=method):
+                self.client.cookies.clear()
+                cache.clear()
+                response, replica, primary = self.request(
+                    method, url if method == 'put' else '/api/recipes/',
+                    {'name': 'Без остальных полей'})
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(replica, [])
+                self.assertTrue(primary)
+                self.assertIn(settings.REPLICA_STICKY_COOKIE,
+                              response.cookies)
+
+    def test_sticky_cookie_keeps_primary(self):
+        self.client.cookies[settings.REPLICA_STICKY_COOKIE] = '1'
+        response, replica, _ = self.request('get', '/api/tags/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(replica, [])
+
+    def test_sticky_cache_marker_keeps_primary(self):
+        self.request('post', '/api/recipes/', {})
+        self.client.cookies.clear()
+        response, replica, _ = self.request('get', '/api/tags/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(replica, [])
+
+    def test_token_is_read_from_primary(self):
+        response, replica, primary = self.request('get', '/api/users/me/')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(any(
+            'authtoken_token' in query['sql'] for query in replica))
+        self.assertTrue(any(
+            'authtoken_token' in query['sql'] for query in primary))
+
+    def test_batch_reads_from_replica_without_sticking(self):
+        response, replica, _ = self.request('post', '/api/batch/', {
+            'requests': [{'path': '/api/tags/'}],
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['responses'][0]['status'], 200)
+        self.assertTrue(replica)
+        self.assertNotIn(settings.REPLICA_STICKY_COOKIE, response.cookies)
@@ -1,16 +1,25 @@
 from django.urls import include, path
 from rest_framework.routers import SimpleRouter
 
-from .views import (UserViewSet, IngredientViewSet,
-                    TagViewSet, RecipeViewSet)
+from .views import (BatchView, UserViewSet, IngredientViewSet,
+                    JobViewSet, TagViewSet, RecipeViewSet)
 
 router_v1 = SimpleRouter()
 router_v1.register('users', UserViewSet, basename='users')
 router_v1.register('recipes', RecipeViewSet, basename='recipes')
 router_v1.register('tags', TagViewSet, basename='tags')
 router_v1.register('ingredients', IngredientViewSet, basename='ingredients')
+router_v1.register('jobs', JobViewSet, basename='jobs')
+
+
+class BatchURLConf:
+    """Маршруты, доступные в пакетных запросах."""
+
+    urlpatterns = [path('api/', include(router_v1.urls))]
+
 
 urlpatterns = [
+    path('batch/', BatchView.as_view(urlconf=BatchURLConf), name='batch'),
     path('', include(router_v1.urls)),
     path('auth/', include('djoser.urls.authtoken')),
 ]
@@ -1,39 +1,86 @@
 from django.conf import settings
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import F, Value
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response
+from django.utils.decorators import method_decorator
+from django.utils.http import quote_etag
+from django.views.decorators.http import condition
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet as DjoserUserViewSet
-from rest_framework import status, viewsets
+from rest_framework import mixins, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
+from .batch import dispatch_subrequest
+from .cache import (cache_response, dependency_versions,
+                    get_cached_response,
+                    recipe_dependencies, recipe_list_base_dependencies,
+                    recipe_list_dependencies)
+from .conditions import (catalog_etag, catalog_last_modified, recipe_etag,
+                         recipe_last_modified)
 from .filters import IngredientFilter, RecipeFilter
-from .paginations import LimitPageNumberPagination
+from .paginations import (FeedPagination, LimitPageNumberPagination,
+                          RecipePagination, SubscriptionPagination)
 from .permissions import IsAuthorOrReadOnly
-from .serializers import (FavoriteRecipeSerializer, IngredientSerializer,
-                          RecipeReadSerializer, RecipeShortSerializer,
-                          RecipeWriteSerializer, SetAvatarSerializer,
+from .renderers import SHOPPING_LIST_RENDERERS
+from .serializers import (BatchSerializer, IngredientSerializer,
+                          JobSerializer, RecipeReadSerializer,
+                          RecipeShortSerializer, RecipeWriteSerializer,
+                          SetAvatarSerializer, ShoppingCartBulkSerializer,
+                          SimilarRecipeSerializer,
                           SubscribeSerializer, SubscribeViewSerializer,
-                          ShoppingCartSerializer, TagSerializer)
-from recipes.models import (FavoriteRecipe, Ingredient,
-                            Recipe, RecipeIngredients,
+                          TagSerializer,
+                          get_recipes_limit)
+from .tasks import export_shopping_list
+from recipes.ingredient_index import ingredient_index
+from recipes.links import get_short_code
+from recipes.models import (CatalogVersion, FavoriteRecipe, FeedEntry,
+                            Ingredient, Recipe, RecipeSimilarity,
                             ShoppingCart, Tag)
 from users.models import Subscribe, User
+from users.tasks import resize_avatar
 
 
+tags_condition = condition(
+    etag_func=catalog_etag(CatalogVersion.TAGS),
+    last_modified_func=catalog_last_modified(CatalogVersion.TAGS),
+)
+ingredients_condition = condition(
+    etag_func=catalog_etag(CatalogVersion.INGREDIENTS),
+    last_modified_func=catalog_last_modified(CatalogVersion.INGREDIENTS),
+)
+recipe_condition = condition(
+    etag_func=recipe_etag,
+    last_modified_func=recipe_last_modified,
+)
+
+
+@method_decorator(tags_condition, name='list')
+@method_decorator(tags_condition, name='retrieve')
 class TagViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
 
 
+@method_decorator(ingredients_condition, name='list')
+@method_decorator(ingredients_condition, name='retrieve')
 class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     filter_backends = (DjangoFilterBackend,)
     filterset_class = IngredientFilter
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name:
+            return Response(ingredient_index.search(name))
+        return super().list(request, *args, **kwargs)
+
 
 class UserViewSet(DjoserUserViewSet):
     queryset = User.objects.all()
@@ -49,6 +96,7 @@ class UserViewSet(DjoserUserViewSet):
         detail=True,
         permission_classes=(IsAuthenticated,),
     )
+    @transaction.atomic
     def subscribe(self, request, id):
         author = get_object_or_404(User, id=id)
         serializer = SubscribeSerializer(
@@ -79,13 +127,22 @@ class UserViewSet(DjoserUserViewSet):
         detail=False,
         methods=('get',),
         permission_classes=(IsAuthenticated,),
+        pagination_class=SubscriptionPagination,
     )
     def subscriptions(self, request):
+        authors = self.paginate_queryset(
+            User.objects.filter(subscribing__user=request.user).annotate(
+                is_subscribed=Value(True),
+                subscription_id=F('subscribing__id'),
+            ).order_by('email')
+        )
+        latest_recipes = Recipe.objects.latest_by_author(
+            [author.id for author in authors], get_recipes_limit(request))
+        for author in authors:
+            author.latest_recipes = latest_recipes[author.id]
         return self.get_paginated_response(
             SubscribeViewSerializer(
-                self.paginate_queryset(
-                    User.objects.filter(subscribing__user=request.user)
-                ),
+                authors,
                 many=True,
                 context={'request': request}
             ).data
@@ -101,53 +158,74 @@ class UserViewSet(DjoserUserViewSet):
         serializer = SetAvatarSerializer(request.user, data=request.data)
         serializer.is_valid(raise_exception=True)
         serializer.save()
+        resize_avatar.enqueue((request.user.id,), user=request.user)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
     @set_avatar.mapping.delete
     def delete_avatar(self, request):
         setattr(request.user, 'avatar', None)
-        request.user.save()
+        request.user.save(update_fields=('avatar',))
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+@method_decorator(recipe_condition, name='retrieve')
 class RecipeViewSet(viewsets.ModelViewSet):
-    pagination_class = LimitPageNumberPagination
+    pagination_class = RecipePagination
     permission_classes = (IsAuthorOrReadOnly,)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
 
     def get_queryset(self):
         if self.request.user.is_authenticated:
-            return Recipe.objects.prefetch_related(
-                'tags', 'ingredients').select_related(
-                'author').annotate_user_recipe(self.request.user)
-        return Recipe.objects.prefetch_related(
-            'tags', 'ingredients').select_related(
-            'author')
+            return Recipe.objects.with_related().annotate_user_recipe(
+                self.request.user)
+        return Recipe.objects.with_related()
 
     def get_serializer_class(self):
         if self.request.method in ('POST', 'PUT', 'PATCH'):
             return RecipeWriteSerializer
         return RecipeReadSerializer
 
+    def list(self, request, *args, **kwargs):
+        if not request.user.is_anonymous:
+            return super().list(request, *args, **kwargs)
+        data = get_cached_response(request)
+        if data is not None:
+            return Response(data)
+        versions = dependency_versions(recipe_list_base_dependencies(request))
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            cache_response(request, response.data,
+                           recipe_list_dependencies(request, response.data),
+                           versions)
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        if not request.user.is_anonymous:
+            return super().retrieve(request, *args, **kwargs)
+        data = get_cached_response(request)
+        if data is not None:
+            return Response(data)
+        versions = dependency_versions((f'recipe:{kwargs["pk"]}',))
+        response = super().retrieve(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            cache_response(request, response.data,
+                           recipe_dependencies(response.data), versions)
+        return response
+
     @action(
         detail=True,
         methods=['post'],
         permission_classes=[IsAuthenticated]
     )
     def favorite(self, request, pk):
-        return self.create_object(FavoriteRecipeSerializer, request, pk)
+        return self.create_object(
+            FavoriteRecipe, request, pk,
+            'Рецепт уже добавлен в избранное.')
 
     @favorite.mapping.delete
     def favorite_delete(self, request, pk):
-        recipe = get_object_or_404(Recipe, pk=pk)
-        is_deleted, _ = FavoriteRecipe.objects.filter(
-            user=request.user,
-            recipe=recipe).delete()
-        if not is_deleted:
-            return Response({"message": "Не удалось удалить"},
-                            status=status.HTTP_400_BAD_REQUEST)
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        return self.delete_object(FavoriteRecipe, request, pk)
 
     @action(
         detail=True,
@@ -155,64 +233,141 @@ class RecipeViewSet(viewsets.ModelViewSet):
         permission_classes=[IsAuthenticated]
     )
     def shopping_cart(self, request, pk):
-        return self.create_object(ShoppingCartSerializer, request, pk)
+        return self.create_object(
+            ShoppingCart, request, pk,
+            'Рецепт уже добавлен в список покупок.')
 
     @shopping_cart.mapping.delete
     def shopping_cart_delete(self, request, pk):
-        recipe = get_object_or_404(Recipe, pk=pk)
-        is_deleted, _ = (
-            ShoppingCart.objects.filter(
-                user=request.user, recipe=recipe).delete()
+        return self.delete_object(ShoppingCart, request, pk)
+
+    @action(
+        detail=False,
+        methods=('post',),
+        permission_classes=(IsAuthenticated,),
+        url_path='shopping_cart/bulk',
+    )
+    def shopping_cart_bulk(self, request):
+        serializer = ShoppingCartBulkSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            added = ShoppingCart.objects.add_recipes(
+                request.user.id, serializer.validated_data.get('add', ()))
+            removed = ShoppingCart.objects.remove_recipes(
+                request.user.id, serializer.validated_data.get('remove', ()))
+        return Response({'added': added, 'removed': removed})
+
+    @action(
+        detail=False,
+        methods=('get',),
+        permission_classes=(IsAuthenticated,),
+        pagination_class=FeedPagination,
+    )
+    def feed(self, request):
+        recipes = self.paginator.paginate_feed(
+            FeedEntry.objects.filter(user=request.user),
+            Recipe.objects.filter(
+                author__in=FeedEntry.objects.merged_authors(request.user)),
+            self.get_queryset(),
+            request,
         )
-        if not is_deleted:
-            return Response({"message": "Не удалось удалить"},
-                            status=status.HTTP_400_BAD_REQUEST)
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        serializer = self.get_serializer(recipes, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        detail=True,
+        methods=('get',),
+        permission_classes=(AllowAny,),
+    )
+    def similar(self, request, pk):
+        if not pk.isdigit():
+            raise Http404
+        try:
+            limit = min(int(request.query_params['limit']),
+                        settings.SIMILAR_RECIPES_TOP_K)
+        except (KeyError, ValueError):
+            limit = settings.SIMILAR_RECIPES_LIMIT
+        entries = RecipeSimilarity.objects.filter(
+            recipe_id=pk
+        ).select_related('similar').only(
+            'score', 'similar__id', 'similar__name', 'similar__image',
+            'similar__image_renditions', 'similar__cooking_time',
+        ).order_by('-score', 'similar_id')[:max(limit, 0)]
+        recipes = []
+        for entry in entries:
+            entry.similar.score = entry.score
+            recipes.append(entry.similar)
+        if not recipes:
+            get_object_or_404(Recipe.objects.only('id'), pk=pk)
+        return Response(SimilarRecipeSerializer(recipes, many=True).data)
 
     @staticmethod
-    def create_object(serializer_name, request, pk):
-        recipe = get_object_or_404(Recipe, pk=pk)
-        serializer = serializer_name(
-            data={'user': request.user.id, 'recipe': recipe.pk, },
-            context={'request': request}
+    def create_object(model, request, pk, message):
+        recipe = get_object_or_404(
+            Recipe.objects.only(
+                'id', 'name', 'image', 'image_renditions', 'cooking_time'),
+            pk=pk,
         )
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
+        if not model.objects.add_recipes(request.user.id, (recipe.id,)):
+            raise ValidationError({'recipe': [message]})
         return Response(
-            RecipeShortSerializer(
-                get_object_or_404(Recipe, id=pk)
-            ).data,
+            RecipeShortSerializer(recipe).data,
             status=status.HTTP_201_CREATED
         )
 
     @staticmethod
-    def create_shopping_list(ingredients):
-        shopping_list = ('Список покупок\n\n')
-        shopping_list += '\n'.join([
-            f'- {ingredient["ingredient__name"]} '
-            f'({ingredient["ingredient__measurement_unit"]})'
-            f' - {ingredient["amount"]}'
-            for ingredient in ingredients
-        ])
-        filename = 'shopping_list.txt'
-        response = HttpResponse(shopping_list, content_type='text/plain')
+    def delete_object(model, request, pk):
+        if not pk.isdigit():
+            raise Http404
+        if not model.objects.remove_recipes(request.user.id, (pk,)):
+            get_object_or_404(Recipe, pk=pk)
+            return Response({"message": "Не удалось удалить"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @staticmethod
+    def create_shopping_list(rows, renderer):
+        response = StreamingHttpResponse(
+            renderer.stream(rows),
+            content_type=f'{renderer.media_type}; charset={renderer.charset}'
+        )
+        filename = f'shopping_list.{renderer.format}'
         response['Content-Disposition'] = f'attachment; filename={filename}'
         return response
 
     @action(detail=False,
             methods=['get'],
-            permission_classes=[IsAuthorOrReadOnly])
+            permission_classes=[IsAuthenticated],
+            renderer_classes=SHOPPING_LIST_RENDERERS)
     def download_shopping_cart(self, request):
-        user = request.user
-        if not user.carts.exists():
+        renderer = request.accepted_renderer
+        ingredients = request.user.cart_ingredients.all()
+        digest = ingredients.digest()
+        if digest is None:
             return Response(status=status.HTTP_400_BAD_REQUEST)
-        ingredients = RecipeIngredients.objects.filter(
-            recipe__carts__user=request.user).values(
+        if request.query_params.get('deferred'):
+            job = export_shopping_list.enqueue(
+                (request.user.id, renderer.format), user=request.user)
+            return Response(
+                JobSerializer(job).data,
+                status=status.HTTP_202_ACCEPTED,
+                content_type='application/json',
+            )
+        etag = quote_etag(f'{digest}-{renderer.format}')
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+        response = self.create_shopping_list(
+            ingredients.values_list(
                 'ingredient__name',
-                'ingredient__measurement_unit').annotate(
-                    amount=Sum('amount')).order_by(
-                        'ingredient__name')
-        return self.create_shopping_list(ingredients)
+                'ingredient__measurement_unit',
+                'amount'
+            ).order_by('ingredient__name').iterator(
+                chunk_size=settings.SHOPPING_LIST_CHUNK_SIZE),
+            renderer,
+        )
+        response['ETag'] = etag
+        return response
 
     @action(
         detail=True,
@@ -221,8 +376,41 @@ class RecipeViewSet(viewsets.ModelViewSet):
         url_path='get-link',
     )
     def get_link(self, request, pk):
-        recipe = get_object_or_404(Recipe, pk=pk)
+        short_code = get_short_code(pk) if pk.isdigit() else None
+        if short_code is None:
+            raise Http404
         short_link = request.build_absolute_uri(
-            f'/{settings.SHORT_LINK_PREFIX_PATH}{recipe.short_link}'
+            f'/{settings.SHORT_LINK_PREFIX_PATH}{short_code}'
         )
         return Response({'short-link': short_link})
+
+
+class JobViewSet(mixins.ListModelMixin,
+                 mixins.RetrieveModelMixin,
+                 viewsets.GenericViewSet):
+    serializer_class = JobSerializer
+    permission_classes = (IsAuthenticated,)
+    pagination_class = LimitPageNumberPagination
+
+    def get_queryset(self):
+        return self.request.user.jobs.all()
+
+
+class BatchView(APIView):
+    """Выполняет несколько GET-запросов к API за один HTTP-запрос."""
+
+    permission_classes = (AllowAny,)
+    urlconf = None
+    # Подзапросы только читают, поэтому пакет идет на реплики
+    # и не закрепляет клиента за основной базой.
+    replica_reads = True
+
+    def post(self, request):
+        serializer = BatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response({
+            'responses': [
+                dispatch_subrequest(request, item['path'], self.urlconf)
+                for item in serializer.validated_data['requests']
+            ]
+        })
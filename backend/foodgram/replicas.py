@@ -0,0 +1,128 @@
+import random
+from contextvars import ContextVar
+from hashlib import sha256
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+SAFE_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS'))
+
+# Состояние текущего запроса, вне запросов чтение идет с основной базы.
+request_state = ContextVar('replica_request_state', default=None)
+
+
+class RequestState:
+    def __init__(self, use_replica):
+        self.use_replica = use_replica
+        self.read_only = False
+        self.wrote = False
+
+
+class ReplicaRouter:
+    """
+    Направляет чтение безопасных запросов API на реплики.
+
+    Запись и все запросы вне ReplicaMiddleware идут в основную базу.
+    После первой записи запрос до конца читает из основной базы.
+    Модели из REPLICA_PRIMARY_MODELS всегда читаются из основной базы:
+    только что выданный токен может еще не дойти до реплики.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = request_state.get()
+        if (state is None or not state.use_replica
+                or not settings.DATABASE_REPLICAS
+                or model._meta.label_lower in settings.REPLICA_PRIMARY_MODELS):
+            return None
+        instance = hints.get('instance')
+        if (instance is not None
+                and instance._state.db in settings.DATABASE_REPLICAS):
+            return instance._state.db
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        state = request_state.get()
+        if state is not None:
+            state.use_replica = False
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if {obj1._state.db, obj2._state.db} <= databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+def sticky_key(request):
+    authorization = request.META.get('HTTP_AUTHORIZATION')
+    if not authorization:
+        return None
+    digest = sha256(authorization.encode()).hexdigest()
+    return f'db-primary:{digest}'
+
+
+class ReplicaMiddleware:
+    """
+    Включает чтение с реплик для GET, HEAD и OPTIONS.
+
+    Представление с атрибутом replica_reads = True читает с реплик
+    при любом методе: так работает пакетный запрос, который приходит
+    POST-ом, но только читает.
+
+    После записи клиент на REPLICA_STICKY_SECONDS закрепляется за
+    основной базой, чтобы видеть свои изменения: браузер - по cookie,
+    клиент с токеном - по метке в общем кэше.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+        request.replica_sticky = self.is_sticky(request)
+        state = RequestState(
+            request.method in SAFE_METHODS and not request.replica_sticky)
+        token = request_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            request_state.reset(token)
+        if state.wrote or (request.method not in SAFE_METHODS
+                           and not state.read_only):
+            self.stick(request, response)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = request_state.get()
+        view_class = getattr(view_func, 'view_class', None)
+        if state is None or not getattr(view_class, 'replica_reads', False):
+            return None
+        state.read_only = True
+        state.use_replica = not request.replica_sticky
+        return None
+
+    @staticmethod
+    def is_sticky(request):
+        if settings.REPLICA_STICKY_COOKIE in request.COOKIES:
+            return True
+        key = sticky_key(request)
+        return key is not None and cache.get(key) is not None
+
+    @staticmethod
+    def stick(request, response):
+        response.set_cookie(
+            settings.REPLICA_STICKY_COOKIE, '1',
+            max_age=settings.REPLICA_STICKY_SECONDS,
+            httponly=True, samesite='Lax',
+        )
+        key = sticky_key(request)
+        if key is not None:
+            cache.set(key, True, timeout=settings.REPLICA_STICKY_SECONDS)
@@ -35,11 +35,13 @@ INSTALLED_APPS = [
     'colorfield',
     'users',
     'recipes',
+    'jobs',
     'api',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'foodgram.replicas.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -84,6 +86,40 @@ DATABASES = {
 }
 DATABASES['default'] = DATABASES[os.getenv('DB_MODE', 'postgres')]
 
+# Реплики для чтения: хосты postgres (host[:port]) или файлы sqlite3
+# через запятую, например DB_REPLICAS=db-replica-1,db-replica-2:5433.
+# Реплики не мигрируются; файлы sqlite3 заполняет sync_sqlite_replicas.
+DATABASE_REPLICAS = []
+for number, location in enumerate(
+        filter(None, os.getenv('DB_REPLICAS', default='').split(',')),
+        start=1):
+    replica = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+    if replica['ENGINE'].endswith('sqlite3'):
+        replica['NAME'] = location.strip()
+    else:
+        host, _, port = location.strip().partition(':')
+        replica.update(HOST=host, PORT=port or replica['PORT'])
+    DATABASES[f'replica_{number}'] = replica
+    DATABASE_REPLICAS.append(f'replica_{number}')
+# Зеркало основной базы для тестов маршрутизации, в DATABASE_REPLICAS
+# не входит и вне тестов не используется.
+DATABASES['replica_test'] = {
+    **DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+DATABASE_ROUTERS = ['foodgram.replicas.ReplicaRouter']
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', default=10))
+REPLICA_STICKY_COOKIE = 'db_primary'
+REPLICA_PRIMARY_MODELS = frozenset(('authtoken.token',))
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default=''),
+    }
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -118,7 +154,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
@@ -146,5 +182,51 @@ RECIPES_NAME_MAX_LENGTH = 256
 USER_FIELD_MAX_LENGTH = 150
 MAX_POSITIVE_INTEGER = 2147483647
 
+MAX_PAGE_SIZE = 100
+BATCH_MAX_REQUESTS = 20
+RESPONSE_CACHE_ALIAS = 'default'
+RESPONSE_CACHE_TIMEOUT = 300
+SHOPPING_LIST_CHUNK_SIZE = 2000
+RECIPE_IMPORT_BATCH_SIZE = 1000
+SHOPPING_CART_BULK_LIMIT = 100
+FEED_FANOUT_MAX_SUBSCRIBERS = 1000
+FEED_FANOUT_BATCH_SIZE = 1000
+FEED_BACKFILL_SIZE = 100
+SIMILAR_RECIPES_TOP_K = 20
+SIMILAR_RECIPES_LIMIT = 6
+SIMILAR_RECIPES_TAG_BONUS = 0.1
+SIMILAR_RECIPES_CHUNK_SIZE = 1000
+COMPOSITION_INDEX_TTL = 300
+COMPOSITION_INDEX_MAX_CHANGES = 1000
+COMPOSITION_SEARCH_LIMIT = 1000
+INGREDIENTS_CSV = BASE_DIR / 'data/ingredients.csv'
+CATALOG_BATCH_SIZE = 1000
+
+IMAGE_RENDITIONS_PATH = 'recipes/renditions/'
+IMAGE_RENDITIONS = {
+    'card': {'size': (480, 480), 'format': 'JPEG', 'quality': 80},
+    'detail': {'size': (1280, 1280), 'format': 'JPEG', 'quality': 85},
+    'webp': {'size': (480, 480), 'format': 'WEBP', 'quality': 80},
+}
+IMAGE_RENDITIONS_WORKERS = None
+AVATAR_SIZE = 256
+AVATAR_QUALITY = 85
+SHOPPING_LIST_EXPORT_PATH = 'shopping_lists/'
+
+JOBS_EAGER = os.getenv('JOBS_EAGER', 'False') == 'True'
+JOBS_WORKERS = None
+JOBS_POLL_INTERVAL = 1
+JOBS_VISIBILITY_TIMEOUT = 300
+JOBS_MAX_ATTEMPTS = 3
+JOBS_RETRY_DELAY = 10
+
 SHORT_LINK_PREFIX_PATH = 's/'
+SHORT_LINK_CACHE_TIMEOUT = 60 * 60 * 24
+SHORT_LINK_NEGATIVE_CACHE_TIMEOUT = 60
+SHORT_LINK_LRU_SIZE = 10000
+SHORT_LINK_LRU_TTL = 60
+AUTH_TOKEN_LRU_SIZE = 10000
+AUTH_TOKEN_LRU_TTL = 60
+AUTH_TOKEN_CACHE_TIMEOUT = 300
+AUTH_TOKEN_USER_TIMEOUT = 60 * 60 * 24
 RECIPE_URL_PATTERN = '/recipes/{recipe_id}/'
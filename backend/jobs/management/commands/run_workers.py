@@ -0,0 +1,81 @@
+import multiprocessing
+import os
+import socket
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from time import sleep
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from jobs.models import Job
+from jobs.queue import run_job
+
+
+class Command(BaseCommand):
+    help = 'Выполняет фоновые задачи из очереди в пуле процессов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int,
+            default=settings.JOBS_WORKERS or os.cpu_count(),
+            help='Число процессов, по умолчанию по числу ядер.')
+        parser.add_argument(
+            '--poll-interval', type=float,
+            default=settings.JOBS_POLL_INTERVAL,
+            help='Пауза между проверками пустой очереди, в секундах.')
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Выполнить доступные задачи и завершиться.')
+
+    def create_pool(self, workers):
+        return ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=django.setup,
+        )
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('Число процессов должно быть больше нуля.')
+        worker = f'{socket.gethostname()}:{os.getpid()}'
+        running = set()
+        done = 0
+        self.stdout.write(
+            f'Обработчик {worker}, процессов: {options["workers"]}.')
+        executor = self.create_pool(options['workers'])
+        try:
+            while True:
+                close_old_connections()
+                free = options['workers'] - len(running)
+                claimed = Job.objects.claim(worker, free) if free else []
+                try:
+                    running.update(
+                        executor.submit(run_job, job_id)
+                        for job_id in claimed)
+                except BrokenProcessPool as error:
+                    # Задачи упавшего пула вернутся в очередь по таймауту.
+                    self.stderr.write(f'Сбой обработчика: {error!r}')
+                    executor.shutdown(wait=False)
+                    executor = self.create_pool(options['workers'])
+                    running = set()
+                if not running:
+                    if options['once'] and not claimed:
+                        break
+                    sleep(options['poll_interval'])
+                    continue
+                finished, running = wait(
+                    running, timeout=options['poll_interval'],
+                    return_when=FIRST_COMPLETED)
+                for future in finished:
+                    error = future.exception()
+                    if error is not None:
+                        self.stderr.write(f'Сбой обработчика: {error!r}')
+                done += len(finished)
+        except KeyboardInterrupt:
+            self.stdout.write('Остановка, ожидание текущих задач.')
+        finally:
+            executor.shutdown(wait=True)
+        self.stdout.write(self.style.SUCCESS(f'Выполнено задач: {done}.'))
@@ -0,0 +1,118 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+
+class JobQuerySet(models.QuerySet):
+    def available(self, now=None):
+        """Задачи, которые можно взять в работу прямо сейчас."""
+        now = now or timezone.now()
+        return self.filter(
+            Q(status=Job.QUEUED, run_after__lte=now)
+            | Q(status=Job.RUNNING, locked_until__lt=now,
+                attempts__lt=F('max_attempts'))
+        )
+
+    def exhausted(self, now=None):
+        """Зависшие задачи, у которых не осталось попыток."""
+        now = now or timezone.now()
+        return self.filter(status=Job.RUNNING, locked_until__lt=now,
+                           attempts__gte=F('max_attempts'))
+
+    def claim(self, worker, limit):
+        """
+        Забирает задачи в работу и скрывает их от других обработчиков.
+
+        Задача, не завершенная до locked_until, снова становится
+        доступной, поэтому упавший обработчик не теряет задачи.
+        Если попыток не осталось, задача отмечается ошибкой.
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            self.exhausted(now).update(
+                status=Job.FAILED,
+                locked_until=None,
+                error='Обработчик не завершил задачу до таймаута.',
+                updated_at=now,
+                finished_at=now,
+            )
+            ids = list(
+                self.available(now)
+                .select_for_update(skip_locked=True)
+                .order_by('-priority', 'run_after', 'id')
+                .values_list('id', flat=True)[:limit]
+            )
+            if ids:
+                self.filter(id__in=ids).update(
+                    status=Job.RUNNING,
+                    attempts=models.F('attempts') + 1,
+                    locked_until=now + timedelta(
+                        seconds=settings.JOBS_VISIBILITY_TIMEOUT),
+                    worker=worker,
+                    updated_at=now,
+                )
+        return ids
+
+
+class Job(models.Model):
+    """Модель фоновой задачи."""
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Выполнена'),
+        (FAILED, 'Ошибка'),
+    )
+
+    name = models.CharField('Задача', max_length=128)
+    args = models.JSONField('Аргументы', default=list, blank=True)
+    kwargs = models.JSONField('Именованные аргументы', default=dict,
+                              blank=True)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='jobs',
+        verbose_name='Пользователь',
+    )
+    status = models.CharField(
+        'Статус', max_length=16, choices=STATUS_CHOICES, default=QUEUED)
+    priority = models.SmallIntegerField(
+        'Приоритет', default=0, help_text='Больше - раньше')
+    attempts = models.PositiveSmallIntegerField('Попыток', default=0)
+    max_attempts = models.PositiveSmallIntegerField(
+        'Максимум попыток', default=3)
+    run_after = models.DateTimeField('Не раньше', default=timezone.now)
+    locked_until = models.DateTimeField(
+        'Занята до', null=True, blank=True)
+    worker = models.CharField('Обработчик', max_length=128, blank=True)
+    result = models.JSONField('Результат', null=True, blank=True)
+    error = models.TextField('Ошибка', blank=True)
+    created_at = models.DateTimeField('Дата создания', auto_now_add=True)
+    updated_at = models.DateTimeField('Дата изменения', auto_now=True)
+    finished_at = models.DateTimeField(
+        'Дата завершения', null=True, blank=True)
+
+    objects = JobQuerySet.as_manager()
+
+    class Meta:
+        ordering = ('-created_at',)
+        verbose_name = 'Фоновая задача'
+        verbose_name_plural = 'Фоновые задачи'
+        indexes = [
+            models.Index(
+                fields=('status', '-priority', 'run_after'),
+                name='job_queue_idx',
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.name} #{self.id} ({self.status})'
@@ -0,0 +1,85 @@
+import logging
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+registry = {}
+
+
+def task(func=None, *, name=None, priority=0, max_attempts=None):
+    """
+    Регистрирует функцию как фоновую задачу.
+
+    Аргументы и результат задачи хранятся в JSON, поэтому передавать
+    нужно идентификаторы объектов, а не сами объекты.
+    """
+    def register(func):
+        func.task_name = name or f'{func.__module__}.{func.__name__}'
+        func.priority = priority
+        func.max_attempts = max_attempts or settings.JOBS_MAX_ATTEMPTS
+        func.enqueue = partial(enqueue, func)
+        registry[func.task_name] = func
+        return func
+    return register if func is None else register(func)
+
+
+def enqueue(func, args=(), kwargs=None, *, user=None, priority=None):
+    """Ставит задачу в очередь, в режиме JOBS_EAGER выполняет сразу."""
+    job = Job.objects.create(
+        name=func.task_name,
+        args=list(args),
+        kwargs=kwargs or {},
+        user=user,
+        priority=func.priority if priority is None else priority,
+        max_attempts=func.max_attempts,
+    )
+    if settings.JOBS_EAGER:
+        transaction.on_commit(partial(run_eagerly, job.id))
+    return job
+
+
+def run_eagerly(job_id):
+    if Job.objects.filter(id=job_id).claim('eager', 1):
+        run_job(job_id)
+
+
+def run_job(job_id):
+    """Выполняет взятую в работу задачу и сохраняет ее итог."""
+    try:
+        job = Job.objects.get(id=job_id, status=Job.RUNNING)
+    except Job.DoesNotExist:
+        return None
+    try:
+        func = registry.get(job.name)
+        if func is None:
+            raise LookupError(f'Задача {job.name} не зарегистрирована.')
+        result = func(*job.args, **job.kwargs)
+    except Exception as error:
+        logger.exception('Задача %s #%s завершилась ошибкой.',
+                         job.name, job.id)
+        return finish_job(job, error=f'{type(error).__name__}: {error}')
+    return finish_job(job, result=result)
+
+
+def finish_job(job, result=None, error=''):
+    now = timezone.now()
+    if not error:
+        changes = {'status': Job.DONE, 'result': result, 'finished_at': now}
+    elif job.attempts < job.max_attempts:
+        delay = settings.JOBS_RETRY_DELAY * 2 ** (job.attempts - 1)
+        changes = {'status': Job.QUEUED,
+                   'run_after': now + timedelta(seconds=delay)}
+    else:
+        changes = {'status': Job.FAILED, 'finished_at': now}
+    # Задачу могли забрать повторно, если она не уложилась в таймаут.
+    Job.objects.filter(
+        id=job.id, worker=job.worker, attempts=job.attempts
+    ).update(locked_until=None, error=error, updated_at=now, **changes)
+    return changes['status']
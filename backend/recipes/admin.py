@@ -28,6 +28,7 @@ class RecipeAdmin(admin.ModelAdmin):
     list_display = (
         'name', 'author',
         'get_ingredients', 'get_tags',
+        'favorites_count', 'carts_count',
         'pub_date', 'pk', 'get_image'
     )
     # exclude = ('short_link',)
@@ -0,0 +1,60 @@
+import csv
+from hashlib import sha256
+from itertools import islice
+
+from django.conf import settings
+
+TAG_DATA = (
+    {'name': 'Завтрак', 'slug': 'breakfast'},
+    {'name': 'Обед', 'slug': 'lunch'},
+    {'name': 'Ужин', 'slug': 'dinner'},
+    {'name': 'Десерт', 'slug': 'dessert'},
+)
+
+
+def file_checksum(path):
+    """Считает контрольную сумму файла, не читая его целиком."""
+    digest = sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_ingredients(path):
+    """Построчно читает CSV вида «название,единица измерения»."""
+    with open(path, encoding='utf-8', newline='') as file:
+        for row in csv.reader(file):
+            if len(row) < 2 or not row[0].strip():
+                continue
+            yield row[0].strip(), row[1].strip()
+
+
+def load_ingredients(ingredient_model, path=None, batch_size=None):
+    """
+    Добавляет ингредиенты пакетами, пропуская уже существующие.
+
+    Принимает модель, поэтому работает и с историческими моделями
+    из миграций. Возвращает число обработанных строк файла.
+    """
+    path = path or settings.INGREDIENTS_CSV
+    batch_size = batch_size or settings.CATALOG_BATCH_SIZE
+    rows = read_ingredients(path)
+    total = 0
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return total
+        ingredient_model.objects.bulk_create(
+            (ingredient_model(name=name, measurement_unit=unit)
+             for name, unit in batch),
+            ignore_conflicts=True,
+        )
+        total += len(batch)
+
+
+def load_tags(tag_model):
+    """Добавляет стандартные теги, пропуская уже существующие."""
+    tag_model.objects.bulk_create(
+        (tag_model(**tag) for tag in TAG_DATA), ignore_conflicts=True)
+    return len(TAG_DATA)
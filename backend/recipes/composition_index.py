@@ -0,0 +1,206 @@
+from threading import Lock
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import CatalogVersion, RecipeIngredients
+
+MATCH_ALL = 'all'
+MATCH_ANY = 'any'
+
+
+def load_pairs(recipe_ids=None):
+    rows = RecipeIngredients.objects.all()
+    if recipe_ids is not None:
+        rows = rows.filter(recipe_id__in=recipe_ids)
+    return np.fromiter(
+        (value for row in rows.values_list(
+            'recipe_id', 'ingredient_id').iterator() for value in row),
+        dtype=np.int64,
+    ).reshape(-1, 2)
+
+
+class CompositionIndex:
+    """Инвертированный индекс состава рецептов в памяти процесса.
+
+    Для каждого ингредиента хранится битовая маска рецептов, в которых
+    он есть, для каждого рецепта - число его ингредиентов. Позиции
+    рецептов упорядочены по id, новые рецепты дописываются в конец.
+
+    Версия индекса хранится в базе в CatalogVersion.COMPOSITION и растет
+    при каждом изменении состава. Списки измененных рецептов лежат
+    в общем кэше под номером версии: процесс догружает только их,
+    а если списка нет - кэш не общий или запись устарела - строит
+    индекс заново. Поэтому индекс не отстает от базы и на кэше
+    в памяти процесса, только чаще перестраивается.
+    """
+
+    change_key = 'composition-index:change:{}'
+
+    def __init__(self, ttl, max_changes):
+        self.ttl = ttl
+        self.max_changes = max_changes
+        self._lock = Lock()
+        self._version = None
+        self._recipe_ids = np.empty(0, dtype=np.int64)
+        self._sizes = np.empty(0, dtype=np.int32)
+        self._bitsets = {}
+
+    def recipes_changed(self, recipe_ids):
+        """
+        Поднимает версию состава и записывает измененные рецепты.
+
+        Версия поднимается в текущей транзакции, строка версии остается
+        заблокированной до коммита, поэтому список успевает попасть
+        в кэш раньше, чем другие процессы увидят новую версию.
+        """
+        recipe_ids = list(recipe_ids)
+        if not recipe_ids:
+            return
+        with transaction.atomic():
+            CatalogVersion.objects.bump(CatalogVersion.COMPOSITION)
+            version = CatalogVersion.objects.current(
+                CatalogVersion.COMPOSITION)
+            cache.set(self.change_key.format(version), recipe_ids,
+                      timeout=self.ttl)
+
+    def invalidate(self):
+        """Перестроить индекс при следующем поиске."""
+        with self._lock:
+            self._version = None
+
+    def build(self):
+        version = CatalogVersion.objects.current(CatalogVersion.COMPOSITION)
+        pairs = load_pairs()
+        recipe_ids = np.unique(pairs[:, 0])
+        positions = np.searchsorted(recipe_ids, pairs[:, 0])
+        capacity = self._capacity(len(recipe_ids))
+        bitsets = {}
+        order = np.argsort(pairs[:, 1], kind='stable')
+        ingredient_ids, starts = np.unique(
+            pairs[order, 1], return_index=True)
+        for ingredient_id, group in zip(
+                ingredient_ids.tolist(), np.split(order, starts[1:])):
+            mask = np.zeros(capacity * 8, dtype=bool)
+            mask[positions[group]] = True
+            bitsets[ingredient_id] = np.packbits(mask, bitorder='little')
+        sizes = np.zeros(capacity * 8, dtype=np.int32)
+        sizes[:len(recipe_ids)] = np.bincount(
+            positions, minlength=len(recipe_ids))
+        self._recipe_ids = recipe_ids
+        self._sizes = sizes
+        self._bitsets = bitsets
+        self._version = version
+
+    @staticmethod
+    def _capacity(count):
+        """Размер масок в байтах с запасом под новые рецепты."""
+        return max(count // 4, 1024)
+
+    def _sync(self):
+        if self._version is None:
+            return self.build()
+        version = CatalogVersion.objects.current(CatalogVersion.COMPOSITION)
+        if version == self._version:
+            return None
+        if not 0 < version - self._version <= self.max_changes:
+            return self.build()
+        keys = [self.change_key.format(number)
+                for number in range(self._version + 1, version + 1)]
+        changes = cache.get_many(keys)
+        if len(changes) != len(keys):
+            return self.build()
+        recipe_ids = sorted(
+            {recipe_id for ids in changes.values() for recipe_id in ids})
+        if len(recipe_ids) > self.max_changes:
+            return self.build()
+        pairs = load_pairs(recipe_ids)
+        composition = {recipe_id: [] for recipe_id in recipe_ids}
+        for recipe_id, ingredient_id in pairs.tolist():
+            composition[recipe_id].append(ingredient_id)
+        for recipe_id, ingredients in composition.items():
+            if not self._apply(recipe_id, ingredients):
+                return self.build()
+        self._version = version
+        return None
+
+    def _apply(self, recipe_id, ingredients):
+        """Обновляет рецепт на месте, False - если нужна перестройка."""
+        position = int(np.searchsorted(self._recipe_ids, recipe_id))
+        exists = (position < len(self._recipe_ids)
+                  and self._recipe_ids[position] == recipe_id)
+        if not exists:
+            if not ingredients:
+                return True
+            if position < len(self._recipe_ids):
+                return False
+            if position >= len(self._sizes):
+                self._grow()
+            self._recipe_ids = np.append(self._recipe_ids, recipe_id)
+        byte, bit = position >> 3, np.uint8(1 << (position & 7))
+        if exists:
+            for bits in self._bitsets.values():
+                bits[byte] &= ~bit
+        capacity = len(self._sizes) // 8
+        for ingredient_id in ingredients:
+            if ingredient_id not in self._bitsets:
+                self._bitsets[ingredient_id] = np.zeros(
+                    capacity, dtype=np.uint8)
+            self._bitsets[ingredient_id][byte] |= bit
+        self._sizes[position] = len(ingredients)
+        return True
+
+    def _grow(self):
+        capacity = len(self._sizes) // 8 * 2
+        self._sizes = np.resize(self._sizes, capacity * 8)
+        self._sizes[len(self._recipe_ids):] = 0
+        for ingredient_id, bits in self._bitsets.items():
+            grown = np.zeros(capacity, dtype=np.uint8)
+            grown[:len(bits)] = bits
+            self._bitsets[ingredient_id] = grown
+
+    def search(self, ingredient_ids, match=MATCH_ANY, max_missing=None,
+               limit=None):
+        """
+        Рецепты из указанных ингредиентов.
+
+        match=all оставляет рецепты со всеми ингредиентами, match=any -
+        хотя бы с одним; max_missing ограничивает число ингредиентов
+        рецепта, которых нет в списке. Возвращает тройки (id рецепта,
+        совпало, не хватает) по убыванию совпадений.
+        """
+        ingredient_ids = set(ingredient_ids)
+        if not ingredient_ids:
+            return []
+        with self._lock:
+            self._sync()
+            count = len(self._recipe_ids)
+            matched = np.zeros(count, dtype=np.int32)
+            for ingredient_id in ingredient_ids:
+                bits = self._bitsets.get(ingredient_id)
+                if bits is not None:
+                    matched += np.unpackbits(
+                        bits, count=count, bitorder='little')
+            missing = self._sizes[:count] - matched
+            recipe_ids = self._recipe_ids
+        if match == MATCH_ALL:
+            found = matched == len(ingredient_ids)
+        else:
+            found = matched > 0
+        if max_missing is not None:
+            found &= missing <= max_missing
+        positions = np.flatnonzero(found)
+        order = np.lexsort((
+            -recipe_ids[positions], missing[positions], -matched[positions]))
+        positions = positions[order[:limit]]
+        return list(zip(recipe_ids[positions].tolist(),
+                        matched[positions].tolist(),
+                        missing[positions].tolist()))
+
+
+composition_index = CompositionIndex(
+    ttl=settings.COMPOSITION_INDEX_TTL,
+    max_changes=settings.COMPOSITION_INDEX_MAX_CHANGES,
+)
@@ -0,0 +1,70 @@
+from bisect import bisect_left, bisect_right
+from threading import Lock
+
+from .models import CatalogVersion, Ingredient
+
+
+class IngredientIndex:
+    """Индекс ингредиентов в памяти процесса для автодополнения.
+
+    Названия хранятся отсортированными в нижнем регистре: совпадения
+    по началу названия находятся бинарным поиском, за ними следуют
+    совпадения по подстроке, ранжированные по позиции вхождения.
+
+    Индекс сверяется с версией справочника CatalogVersion.INGREDIENTS
+    и перестраивается, когда справочник изменил любой процесс.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._snapshot = ([], [], '', [])
+        self._version = None
+
+    def invalidate(self):
+        """Перестроить индекс при следующем поиске."""
+        self._version = None
+
+    def build(self):
+        version = CatalogVersion.objects.current(CatalogVersion.INGREDIENTS)
+        rows = sorted(
+            Ingredient.objects.values('id', 'name', 'measurement_unit'),
+            key=lambda row: (row['name'].casefold(), row['id'])
+        )
+        keys = [row['name'].casefold() for row in rows]
+        offsets, offset = [], 0
+        for key in keys:
+            offsets.append(offset)
+            offset += len(key) + 1
+        with self._lock:
+            self._snapshot = (keys, rows, '\n'.join(keys), offsets)
+            self._version = version
+
+    def _ensure_built(self):
+        version = CatalogVersion.objects.current(CatalogVersion.INGREDIENTS)
+        if version != self._version:
+            self.build()
+
+    def search(self, query):
+        query = query.strip().casefold()
+        self._ensure_built()
+        keys, items, text, offsets = self._snapshot
+        start = position = bisect_left(keys, query)
+        while position < len(keys) and keys[position].startswith(query):
+            position += 1
+        matches = items[start:position]
+        if not query or '\n' in query:
+            return matches
+        # Совпавшие по началу уже в выдаче, подстрокой их не повторяем.
+        found, seen = [], set(range(start, position))
+        position = text.find(query)
+        while position != -1:
+            index = bisect_right(offsets, position) - 1
+            shift = position - offsets[index]
+            if shift and index not in seen:
+                seen.add(index)
+                found.append((shift, keys[index], index))
+            position = text.find(query, position + 1)
+        return matches + [items[index] for _, _, index in sorted(found)]
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,79 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .lru import LocalLRUCache
+from .models import Recipe
+from .short_links import decode_short_link, encode_short_link
+
+MISSING = 0
+NOT_CACHED = object()
+
+local_cache = LocalLRUCache(
+    maxsize=settings.SHORT_LINK_LRU_SIZE, ttl=settings.SHORT_LINK_LRU_TTL)
+
+
+def code_key(code):
+    return f'short-link:{code}'
+
+
+def recipe_key(recipe_id):
+    return f'recipe-short-link:{recipe_id}'
+
+
+def cached_lookup(key, load):
+    """Значение из кэша процесса, общего кэша или базы данных.
+
+    Отсутствие объекта тоже кэшируется, но на меньший срок.
+    """
+    value = local_cache.get(key, NOT_CACHED)
+    if value is not NOT_CACHED:
+        return value
+    value = cache.get(key)
+    if value is None:
+        value = load()
+        cache.set(
+            key,
+            value,
+            timeout=(settings.SHORT_LINK_CACHE_TIMEOUT if value != MISSING
+                     else settings.SHORT_LINK_NEGATIVE_CACHE_TIMEOUT)
+        )
+    local_cache.set(key, value)
+    return value
+
+
+def resolve_short_link(code):
+    """id рецепта по коду короткой ссылки или None."""
+    def load():
+        recipe_id = decode_short_link(code)
+        recipes = (Recipe.objects.filter(short_link=code)
+                   if recipe_id is None
+                   else Recipe.objects.filter(pk=recipe_id))
+        return recipes.values_list('id', flat=True).first() or MISSING
+
+    return cached_lookup(code_key(code), load) or None
+
+
+def get_short_code(recipe_id):
+    """Код короткой ссылки рецепта или None, если рецепта нет."""
+    def load():
+        recipe = Recipe.objects.filter(pk=recipe_id).values_list(
+            'id', 'short_link').first()
+        if recipe is None:
+            return MISSING
+        return recipe[1] or encode_short_link(recipe[0])
+
+    return cached_lookup(recipe_key(recipe_id), load) or None
+
+
+def forget_recipe(recipe):
+    """Сбрасывает все записи о ссылках рецепта после коммита."""
+    keys = [code_key(encode_short_link(recipe.id)), recipe_key(recipe.id)]
+    if recipe.short_link:
+        keys.append(code_key(recipe.short_link))
+
+    def delete():
+        cache.delete_many(keys)
+        for key in keys:
+            local_cache.delete(key)
+    transaction.on_commit(delete)
@@ -0,0 +1,71 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.db import connection, reset_queries, transaction
+from django.test.utils import CaptureQueriesContext
+
+from recipes.models import Recipe
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = ('Замеряет стоимость создания рецепта по мере роста таблицы. '
+            'Все созданные записи откатываются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--total', type=int, default=1_000_000)
+        parser.add_argument('--step', type=int, default=100_000)
+        parser.add_argument('--samples', type=int, default=200)
+        parser.add_argument('--batch-size', type=int, default=10_000)
+
+    def fill(self, author, count, batch_size):
+        while count > 0:
+            size = min(batch_size, count)
+            Recipe.objects.bulk_create(
+                Recipe(
+                    author=author,
+                    name='benchmark',
+                    text='benchmark',
+                    image='recipes/images/benchmark.png',
+                    cooking_time=1,
+                ) for _ in range(size)
+            )
+            count -= size
+
+    def measure(self, author, samples):
+        reset_queries()
+        with CaptureQueriesContext(connection) as context:
+            started = perf_counter()
+            for _ in range(samples):
+                recipe = Recipe.objects.create(
+                    author=author,
+                    name='benchmark',
+                    text='benchmark',
+                    image='recipes/images/benchmark.png',
+                    cooking_time=1,
+                )
+                recipe.short_code
+            elapsed = perf_counter() - started
+        return elapsed / samples * 1000, len(context) / samples
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            author = User.objects.create(
+                username='short_link_benchmark',
+                email='short_link_benchmark@example.com',
+            )
+            rows = 0
+            while True:
+                milliseconds, queries = self.measure(
+                    author, options['samples'])
+                rows += options['samples']
+                self.stdout.write(
+                    f'{rows:>10} рецептов: {milliseconds:.3f} мс '
+                    f'и {queries:.1f} запросов на создание'
+                )
+                if rows >= options['total']:
+                    break
+                step = min(options['step'], options['total'] - rows)
+                self.fill(author, step, options['batch_size'])
+                rows += step
+            transaction.set_rollback(True)
@@ -0,0 +1,73 @@
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from recipes.models import Recipe
+from recipes.renditions import delete_renditions, make_renditions
+from recipes.signals import renditions_updated
+
+
+def make_renditions_safely(recipe_id, name):
+    try:
+        return make_renditions(recipe_id, name), None
+    except Exception as error:
+        return None, repr(error)
+
+
+class Command(BaseCommand):
+    help = ('Создает уменьшенные копии изображений рецептов '
+            'в пуле процессов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Пересоздать копии и у рецептов, где они уже есть.')
+        parser.add_argument(
+            '--workers', type=int, default=settings.IMAGE_RENDITIONS_WORKERS,
+            help='Число процессов, по умолчанию по числу ядер.')
+        parser.add_argument('--batch-size', type=int, default=100)
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('Размер пакета должен быть больше нуля.')
+        recipes = Recipe.objects.exclude(image='')
+        if not options['all']:
+            recipes = recipes.filter(image_renditions={})
+        ids = iter(recipes.order_by('id').values_list('id', flat=True))
+        done = failed = 0
+        with ProcessPoolExecutor(
+            max_workers=options['workers'], initializer=django.setup
+        ) as executor:
+            while True:
+                batch_ids = list(islice(ids, options['batch_size']))
+                if not batch_ids:
+                    break
+                batch = list(Recipe.objects.filter(id__in=batch_ids).only(
+                    'id', 'image', 'image_renditions'))
+                updated, now = [], timezone.now()
+                results = executor.map(
+                    make_renditions_safely,
+                    [recipe.id for recipe in batch],
+                    [recipe.image.name for recipe in batch])
+                for recipe, (renditions, error) in zip(batch, results):
+                    if error:
+                        failed += 1
+                        self.stderr.write(f'Рецепт {recipe.id}: {error}')
+                        continue
+                    delete_renditions(
+                        recipe.image_renditions, keep=renditions.values())
+                    recipe.image_renditions = renditions
+                    recipe.updated_at = now
+                    updated.append(recipe)
+                Recipe.objects.bulk_update(
+                    updated, ('image_renditions', 'updated_at'))
+                renditions_updated.send(
+                    sender=Recipe,
+                    recipe_ids=[recipe.id for recipe in updated])
+                done += len(updated)
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано рецептов: {done}, с ошибками: {failed}.'))
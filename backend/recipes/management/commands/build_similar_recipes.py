@@ -0,0 +1,35 @@
+from itertools import islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.models import RecipeSimilarity
+from recipes.similarity import compute_similarities
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает похожие рецепты для всего каталога.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top-k', type=int, default=settings.SIMILAR_RECIPES_TOP_K,
+            help='Сколько похожих рецептов хранить для каждого рецепта.')
+        parser.add_argument(
+            '--chunk-size', type=int,
+            default=settings.SIMILAR_RECIPES_CHUNK_SIZE,
+            help='Сколько строк матрицы обрабатывать за один шаг.')
+
+    def handle(self, *args, **options):
+        if options['top_k'] < 1 or options['chunk_size'] < 1:
+            raise CommandError('Параметры должны быть больше нуля.')
+        entries = compute_similarities(
+            options['top_k'], options['chunk_size'])
+        total = 0
+        with transaction.atomic():
+            RecipeSimilarity.objects.all().delete()
+            while batch := list(islice(entries, options['chunk_size'])):
+                RecipeSimilarity.objects.bulk_create(batch)
+                total += len(batch)
+        self.stdout.write(self.style.SUCCESS(
+            f'Сохранено похожих рецептов: {total}.'))
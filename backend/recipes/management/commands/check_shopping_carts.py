@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.models import ShoppingCartIngredient
+
+
+class Command(BaseCommand):
+    help = ('Сверяет суммарные списки покупок с корзинами пользователей '
+            'и при необходимости пересобирает их.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Исправить найденные расхождения.',
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            expected = ShoppingCartIngredient.objects.expected_amounts()
+            stored = ShoppingCartIngredient.objects.stored_amounts()
+            deltas = {
+                key: expected.get(key, 0) - stored.get(key, 0)
+                for key in expected.keys() | stored.keys()
+                if expected.get(key, 0) != stored.get(key, 0)
+            }
+            users = {user_id for user_id, _ in deltas}
+            if not deltas:
+                self.stdout.write(self.style.SUCCESS(
+                    'Расхождений не найдено.'))
+                return
+            self.stdout.write(self.style.WARNING(
+                f'Расхождений: {len(deltas)}, '
+                f'пользователей: {len(users)}.'))
+            if options['rebuild']:
+                ShoppingCartIngredient.objects.add_amounts(deltas)
+                self.stdout.write(self.style.SUCCESS(
+                    'Списки покупок пересобраны.'))
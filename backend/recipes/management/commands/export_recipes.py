@@ -0,0 +1,65 @@
+import json
+import sys
+from base64 import b64encode
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Выгружает рецепты в NDJSON: один рецепт на строку.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default='-',
+            help='Файл для выгрузки, по умолчанию stdout.')
+        parser.add_argument(
+            '--inline-images', action='store_true',
+            help='Встраивать изображения в base64 вместо путей.')
+        parser.add_argument(
+            '--chunk-size', type=int,
+            default=settings.RECIPE_IMPORT_BATCH_SIZE)
+
+    def serialize(self, recipe, inline_images):
+        row = {
+            'name': recipe.name,
+            'text': recipe.text,
+            'cooking_time': recipe.cooking_time,
+            'pub_date': recipe.pub_date.isoformat(),
+            'author': recipe.author.email,
+            'short_link': recipe.short_link,
+            'tags': [tag.slug for tag in recipe.tags.all()],
+            'ingredients': [
+                {
+                    'name': item.ingredient.name,
+                    'measurement_unit': item.ingredient.measurement_unit,
+                    'amount': item.amount,
+                }
+                for item in recipe.recipe_ingredients.all()
+            ],
+            'image': recipe.image.name,
+        }
+        if inline_images and recipe.image:
+            with default_storage.open(recipe.image.name, 'rb') as image:
+                row['image_data'] = b64encode(image.read()).decode()
+        return row
+
+    def handle(self, *args, **options):
+        output = (sys.stdout if options['path'] == '-'
+                  else open(options['path'], 'w', encoding='utf-8'))
+        exported = 0
+        try:
+            for recipe in Recipe.objects.with_related().order_by(
+                    'id').iterator(chunk_size=options['chunk_size']):
+                output.write(json.dumps(
+                    self.serialize(recipe, options['inline_images']),
+                    ensure_ascii=False
+                ) + '\n')
+                exported += 1
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        self.stderr.write(f'Выгружено рецептов: {exported}.')
@@ -0,0 +1,185 @@
+import json
+import os
+import sys
+from base64 import b64decode
+from itertools import islice
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from recipes.models import Ingredient, Recipe, RecipeIngredients, Tag
+from recipes.search import update_search_index
+from recipes.signals import recipes_imported
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = ('Загружает рецепты из NDJSON пакетами через bulk_create, '
+            'каждый пакет в отдельной транзакции.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default='-',
+            help='Файл NDJSON, по умолчанию stdin.')
+        parser.add_argument(
+            '--batch-size', type=int,
+            default=settings.RECIPE_IMPORT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('Размер пакета должен быть больше нуля.')
+        self.tags = dict(Tag.objects.values_list('slug', 'id'))
+        self.ingredients = {
+            (name, measurement_unit): ingredient_id
+            for ingredient_id, name, measurement_unit
+            in Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit')
+        }
+        source = (sys.stdin if options['path'] == '-'
+                  else open(options['path'], encoding='utf-8'))
+        imported = skipped = 0
+        try:
+            lines = enumerate(source, start=1)
+            while True:
+                batch = list(islice(lines, options['batch_size']))
+                if not batch:
+                    break
+                rows = []
+                for number, line in batch:
+                    if not line.strip():
+                        continue
+                    try:
+                        row = json.loads(line)
+                    except ValueError as error:
+                        skipped += 1
+                        self.stderr.write(f'Строка {number}: {error}')
+                        continue
+                    if not isinstance(row, dict):
+                        skipped += 1
+                        self.stderr.write(
+                            f'Строка {number}: ожидался объект JSON')
+                        continue
+                    rows.append((number, row))
+                created = self.import_batch(rows)
+                imported += created
+                skipped += len(rows) - created
+        finally:
+            if source is not sys.stdin:
+                source.close()
+        self.stdout.write(self.style.SUCCESS(
+            f'Загружено рецептов: {imported}, пропущено: {skipped}.'))
+
+    def read_image(self, row):
+        """Имя файла изображения и содержимое, если оно передано в строке.
+
+        Файл сохраняется только в транзакции пакета, чтобы пропущенные
+        строки и откаченные пакеты не оставляли файлов в MEDIA_ROOT.
+        """
+        if not row.get('image_data'):
+            return row['image'], None
+        extension = os.path.splitext(row.get('image') or '')[1] or '.png'
+        return (f'recipes/images/{uuid4().hex}{extension}',
+                ContentFile(b64decode(row['image_data'], validate=True)))
+
+    def save_images(self, recipes, images, saved):
+        for recipe, content in zip(recipes, images):
+            if content is not None:
+                recipe.image = default_storage.save(recipe.image.name,
+                                                    content)
+                saved.append(recipe.image.name)
+
+    def validate(self, row, authors):
+        author_id = authors.get(row.get('author'))
+        if author_id is None:
+            raise ValueError(f'нет автора {row.get("author")}')
+        tag_ids = [self.tags[slug] for slug in row['tags']]
+        ingredients = {}
+        for item in row['ingredients']:
+            key = (item['name'], item['measurement_unit'])
+            if key not in self.ingredients:
+                raise ValueError(f'нет ингредиента {key[0]} ({key[1]})')
+            amount = int(item['amount'])
+            if amount < 1:
+                raise ValueError(f'количество {key[0]} меньше 1')
+            ingredients[self.ingredients[key]] = amount
+        if not tag_ids or not ingredients:
+            raise ValueError('нужны теги и ингредиенты')
+        if int(row['cooking_time']) < 1:
+            raise ValueError('время приготовления меньше 1')
+        return author_id, tag_ids, ingredients
+
+    def import_batch(self, rows):
+        authors = dict(User.objects.filter(
+            email__in={row.get('author') for _, row in rows}
+        ).values_list('email', 'id'))
+        taken_links = set(Recipe.objects.filter(
+            short_link__in={row.get('short_link') for _, row in rows}
+        ).values_list('short_link', flat=True))
+        recipes, relations, pub_dates, images = [], [], [], []
+        for number, row in rows:
+            try:
+                author_id, tag_ids, ingredients = self.validate(
+                    row, authors)
+                short_link = row.get('short_link')
+                if short_link in taken_links:
+                    short_link = None
+                image, content = self.read_image(row)
+                recipe = Recipe(
+                    author_id=author_id,
+                    name=row['name'],
+                    text=row['text'],
+                    cooking_time=int(row['cooking_time']),
+                    image=image,
+                    short_link=short_link,
+                )
+                pub_date = parse_datetime(row.get('pub_date') or '')
+                if pub_date is not None and timezone.is_naive(pub_date):
+                    pub_date = timezone.make_aware(pub_date)
+            except (KeyError, TypeError, ValueError) as error:
+                self.stderr.write(f'Строка {number}: {error!r}')
+                continue
+            taken_links.add(short_link)
+            recipes.append(recipe)
+            relations.append((tag_ids, ingredients))
+            pub_dates.append(pub_date)
+            images.append(content)
+        saved = []
+        try:
+            self.write_batch(recipes, relations, pub_dates, images, saved)
+        except BaseException:
+            for name in saved:
+                default_storage.delete(name)
+            raise
+        return len(recipes)
+
+    @transaction.atomic
+    def write_batch(self, recipes, relations, pub_dates, images, saved):
+        self.save_images(recipes, images, saved)
+        Recipe.objects.bulk_create(recipes)
+        # bulk_create ставит дату из auto_now_add, дату из файла
+        # записываем отдельным обновлением.
+        dated = []
+        for recipe, pub_date in zip(recipes, pub_dates):
+            if pub_date is not None:
+                recipe.pub_date = pub_date
+                dated.append(recipe)
+        Recipe.objects.bulk_update(dated, ('pub_date',))
+        RecipeIngredients.objects.bulk_create(
+            RecipeIngredients(
+                recipe=recipe, ingredient_id=ingredient_id, amount=amount)
+            for recipe, (_, ingredients) in zip(recipes, relations)
+            for ingredient_id, amount in ingredients.items()
+        )
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe_id=recipe.id, tag_id=tag_id)
+            for recipe, (tag_ids, _) in zip(recipes, relations)
+            for tag_id in set(tag_ids)
+        )
+        update_search_index(recipes)
+        recipes_imported.send(sender=Recipe, recipes=recipes)
@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.catalog import file_checksum, load_ingredients, load_tags
+from recipes.models import CatalogVersion, Ingredient, Tag
+
+
+class Command(BaseCommand):
+    help = ('Загружает ингредиенты из CSV и стандартные теги, '
+            'пропуская уже существующие записи.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default=settings.INGREDIENTS_CSV,
+            help='CSV с ингредиентами: название,единица измерения.')
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.CATALOG_BATCH_SIZE)
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Загрузить файл, даже если он не изменился.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('Размер пакета должен быть больше нуля.')
+        try:
+            checksum = file_checksum(options['path'])
+        except OSError as error:
+            raise CommandError(f'Не удалось прочитать файл: {error}')
+        with transaction.atomic():
+            catalog, _ = (
+                CatalogVersion.objects.select_for_update()
+                .get_or_create(name=CatalogVersion.INGREDIENTS)
+            )
+            if catalog.checksum == checksum and not options['force']:
+                self.stdout.write('Справочник ингредиентов не изменился.')
+            else:
+                before = Ingredient.objects.count()
+                total = load_ingredients(
+                    Ingredient, options['path'], options['batch_size'])
+                added = Ingredient.objects.count() - before
+                catalog.checksum = checksum
+                catalog.save(update_fields=('checksum', 'updated_at'))
+                if added:
+                    CatalogVersion.objects.bump(CatalogVersion.INGREDIENTS)
+                self.stdout.write(self.style.SUCCESS(
+                    f'Строк в файле: {total}, '
+                    f'добавлено ингредиентов: {added}.'))
+            before = Tag.objects.count()
+            load_tags(Tag)
+            if Tag.objects.count() != before:
+                CatalogVersion.objects.bump(CatalogVersion.TAGS)
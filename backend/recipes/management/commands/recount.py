@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.models import FavoriteRecipe, Recipe, ShoppingCart
+from users.counters import count_subquery, recount
+from users.models import Subscribe, User
+
+COUNTERS = (
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'subscribers_count', Subscribe, 'author'),
+    (Recipe, 'favorites_count', FavoriteRecipe, 'recipe'),
+    (Recipe, 'carts_count', ShoppingCart, 'recipe'),
+)
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счетчики рецептов, подписчиков и избранного.'
+
+    def handle(self, *args, **options):
+        for model, field, related_model, related_field in COUNTERS:
+            with transaction.atomic():
+                fixed = recount(
+                    model.objects.all(), field,
+                    count_subquery(related_model.objects.all(),
+                                   related_field),
+                )
+            self.stdout.write(
+                f'{model._meta.verbose_name_plural}.{field}: '
+                f'исправлено {fixed}.')
@@ -0,0 +1,31 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = ('Копирует основную базу sqlite3 в файлы реплик из DB_REPLICAS. '
+            'Реплики не мигрируются, поэтому команду запускают после '
+            'migrate и при каждом обновлении данных.')
+
+    def handle(self, *args, **options):
+        primary = connections[DEFAULT_DB_ALIAS]
+        if primary.vendor != 'sqlite':
+            raise CommandError(
+                'Команда нужна только для sqlite3, реплики postgres '
+                'заполняет потоковая репликация.')
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError('Реплики не настроены, задайте DB_REPLICAS.')
+        primary.ensure_connection()
+        for alias in settings.DATABASE_REPLICAS:
+            replica = connections[alias]
+            replica.close()
+            target = sqlite3.connect(replica.settings_dict['NAME'])
+            try:
+                primary.connection.backup(target)
+            finally:
+                target.close()
+            self.stdout.write(
+                f'{alias}: скопировано в {replica.settings_dict["NAME"]}.')
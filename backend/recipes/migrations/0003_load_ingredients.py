@@ -1,18 +1,10 @@
-import json
-from django.conf import settings
 from django.db import migrations
 
-
-file_json = open(
-    settings.BASE_DIR / 'data/ingredients.json', 'r', encoding='utf-8')
-INGREDIENT_DATA = json.load(file_json)
+from recipes.catalog import load_ingredients
 
 
 def add_ingredients(apps, schema_editor):
-    Ingredient = apps.get_model("recipes", "Ingredient")
-    for ingredient in INGREDIENT_DATA:
-        new_ingredient = Ingredient(**ingredient)
-        new_ingredient.save()
+    load_ingredients(apps.get_model('recipes', 'Ingredient'))
 
 
 class Migration(migrations.Migration):
@@ -22,5 +14,5 @@ class Migration(migrations.Migration):
     ]
 
     operations = [
-        migrations.RunPython(add_ingredients),
+        migrations.RunPython(add_ingredients, migrations.RunPython.noop),
     ]
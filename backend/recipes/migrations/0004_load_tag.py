@@ -1,18 +1,11 @@
 from django.db import migrations
 
+from recipes.catalog import load_tags
 
-TAG_DATA = [
-    {'name': 'Завтрак', 'slug': 'breakfast'},
-    {'name': 'Обед', 'slug': 'lunch'},
-    {'name': 'Ужин', 'slug': 'dinner'},
-    {'name': 'Десерт', 'slug': 'dessert'},
-]
 
 def add_tags(apps, schema_editor):
-    Tag = apps.get_model('recipes', 'Tag')
-    for tag in TAG_DATA:
-        new_tag = Tag(**tag)
-        new_tag.save()
+    load_tags(apps.get_model('recipes', 'Tag'))
+
 
 class Migration(migrations.Migration):
 
@@ -21,5 +14,5 @@ class Migration(migrations.Migration):
     ]
 
     operations = [
-        migrations.RunPython(add_tags),
+        migrations.RunPython(add_tags, migrations.RunPython.noop),
     ]
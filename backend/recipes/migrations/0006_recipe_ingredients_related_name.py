@@ -0,0 +1,24 @@
+# Generated by Django 4.2.1 on 2026-10-18 03:11
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_alter_ingredient_measurement_unit_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='short_link',
+            field=models.CharField(max_length=16, unique=True, verbose_name='Сокращенная ссылка'),
+        ),
+        migrations.AlterField(
+            model_name='recipeingredients',
+            name='recipe',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recipe_ingredients', to='recipes.recipe', verbose_name='Рецепт'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 4.2.1 on 2026-10-18 03:13
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_cart_ingredients(apps, schema_editor):
+    RecipeIngredients = apps.get_model('recipes', 'RecipeIngredients')
+    ShoppingCartIngredient = apps.get_model(
+        'recipes', 'ShoppingCartIngredient')
+    rows = RecipeIngredients.objects.filter(
+        recipe__carts__isnull=False
+    ).values(
+        'recipe__carts__user_id', 'ingredient_id'
+    ).annotate(total=models.Sum('amount')).order_by()
+    ShoppingCartIngredient.objects.bulk_create(
+        (ShoppingCartIngredient(
+            user_id=row['recipe__carts__user_id'],
+            ingredient_id=row['ingredient_id'],
+            amount=row['total'],
+        ) for row in rows.iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0006_recipe_ingredients_related_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingCartIngredient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.PositiveBigIntegerField(verbose_name='Количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cart_ingredients', to='recipes.ingredient', verbose_name='Ингредиент')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cart_ingredients', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Ингредиент в списке покупок',
+                'verbose_name_plural': 'Ингредиенты в списках покупок',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcartingredient',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='cart_ingredient_unique'),
+        ),
+        migrations.RunPython(
+            fill_cart_ingredients, migrations.RunPython.noop),
+    ]
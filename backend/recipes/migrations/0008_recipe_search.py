@@ -0,0 +1,80 @@
+# Generated by Django 4.2.1 on 2026-10-18 03:15
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+POSTGRES_FORWARD = (
+    """
+    CREATE INDEX recipes_recipe_search_vector_gin
+        ON recipes_recipe USING gin (search_vector)
+    """,
+    """
+    CREATE FUNCTION recipes_recipe_search_vector_update()
+    RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('russian', coalesce(NEW.name, '')), 'A')
+            || setweight(to_tsvector('russian', coalesce(NEW.text, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER recipes_recipe_search_vector_trigger
+        BEFORE INSERT OR UPDATE OF name, text ON recipes_recipe
+        FOR EACH ROW EXECUTE FUNCTION recipes_recipe_search_vector_update()
+    """,
+    'UPDATE recipes_recipe SET name = name',
+)
+POSTGRES_BACKWARD = (
+    'DROP TRIGGER IF EXISTS recipes_recipe_search_vector_trigger '
+    'ON recipes_recipe',
+    'DROP FUNCTION IF EXISTS recipes_recipe_search_vector_update()',
+    'DROP INDEX IF EXISTS recipes_recipe_search_vector_gin',
+)
+SQLITE_FORWARD = (
+    """
+    CREATE VIRTUAL TABLE recipes_recipe_fts USING fts5(
+        name, text, tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    INSERT INTO recipes_recipe_fts (rowid, name, text)
+        SELECT id, name, text FROM recipes_recipe
+    """,
+)
+SQLITE_BACKWARD = (
+    'DROP TABLE IF EXISTS recipes_recipe_fts',
+)
+
+
+def run_vendor_sql(statements):
+    def run(apps, schema_editor):
+        for sql in statements.get(schema_editor.connection.vendor, ()):
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_shoppingcartingredient'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.RunPython(
+            run_vendor_sql({
+                'postgresql': POSTGRES_FORWARD,
+                'sqlite': SQLITE_FORWARD,
+            }),
+            run_vendor_sql({
+                'postgresql': POSTGRES_BACKWARD,
+                'sqlite': SQLITE_BACKWARD,
+            }),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.1 on 2026-10-18 03:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_catalog_version_recipe_updated_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='short_link',
+            field=models.CharField(blank=True, help_text='Заполнено только у рецептов со ссылками старого формата', max_length=16, null=True, unique=True, verbose_name='Сокращенная ссылка'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.1 on 2026-10-18 03:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_recipe_short_link_nullable'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='catalogversion',
+            name='checksum',
+            field=models.CharField(blank=True, max_length=64, verbose_name='Контрольная сумма источника'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.1 on 2026-10-18 03:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_catalog_version_checksum'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Пути к уменьшенным копиям изображения по их названиям', verbose_name='Копии изображения'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 4.2.1 on 2026-10-18 03:39
+
+from django.db import migrations, models
+
+
+def delete_duplicates(model):
+    """Оставляет по одной записи на пару пользователь-рецепт."""
+    keep = model.objects.values('user_id', 'recipe_id').annotate(
+        keep_id=models.Min('id')).values('keep_id')
+    duplicates = model.objects.exclude(id__in=keep)
+    user_ids = set(duplicates.values_list('user_id', flat=True))
+    duplicates.delete()
+    return user_ids
+
+
+def remove_duplicates(apps, schema_editor):
+    delete_duplicates(apps.get_model('recipes', 'FavoriteRecipe'))
+    user_ids = delete_duplicates(apps.get_model('recipes', 'ShoppingCart'))
+    if not user_ids:
+        return
+    # Суммарные списки считали каждую копию, пересобираем их.
+    RecipeIngredients = apps.get_model('recipes', 'RecipeIngredients')
+    ShoppingCartIngredient = apps.get_model(
+        'recipes', 'ShoppingCartIngredient')
+    ShoppingCartIngredient.objects.filter(user_id__in=user_ids).delete()
+    rows = RecipeIngredients.objects.filter(
+        recipe__carts__user_id__in=user_ids
+    ).values(
+        'recipe__carts__user_id', 'ingredient_id'
+    ).annotate(total=models.Sum('amount')).order_by()
+    ShoppingCartIngredient.objects.bulk_create(
+        (ShoppingCartIngredient(
+            user_id=row['recipe__carts__user_id'],
+            ingredient_id=row['ingredient_id'],
+            amount=row['total'],
+        ) for row in rows.iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_recipe_image_renditions'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='favoriterecipe',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='favoriterecipe_unique_user_recipe'),
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcart',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='shoppingcart_unique_user_recipe'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.1 on 2026-10-18 03:43
+
+from django.db import migrations, models
+
+from users.counters import count_subquery
+
+
+def fill_counters(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+    Subscribe = apps.get_model('users', 'Subscribe')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    FavoriteRecipe = apps.get_model('recipes', 'FavoriteRecipe')
+    ShoppingCart = apps.get_model('recipes', 'ShoppingCart')
+    User.objects.update(
+        recipes_count=count_subquery(Recipe.objects.all(), 'author'),
+        subscribers_count=count_subquery(Subscribe.objects.all(), 'author'),
+    )
+    Recipe.objects.update(
+        favorites_count=count_subquery(
+            FavoriteRecipe.objects.all(), 'recipe'),
+        carts_count=count_subquery(ShoppingCart.objects.all(), 'recipe'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_recipe_user_unique'),
+        ('users', '0002_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В списках покупок'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 4.2.1 on 2026-10-18 03:46
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_feeds(apps, schema_editor):
+    """Заполняет ленты последними рецептами авторов из подписок."""
+    User = apps.get_model('users', 'User')
+    Subscribe = apps.get_model('users', 'Subscribe')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    FeedEntry = apps.get_model('recipes', 'FeedEntry')
+    authors = User.objects.filter(
+        subscribers_count__gt=0,
+        subscribers_count__lte=settings.FEED_FANOUT_MAX_SUBSCRIBERS,
+    ).values_list('id', flat=True)
+    for author_id in authors.iterator():
+        recipes = list(Recipe.objects.filter(
+            author_id=author_id
+        ).order_by('-pub_date', '-id').values_list(
+            'id', 'pub_date')[:settings.FEED_BACKFILL_SIZE])
+        subscribers = Subscribe.objects.filter(
+            author_id=author_id).values_list('user_id', flat=True)
+        FeedEntry.objects.bulk_create(
+            (FeedEntry(user_id=user_id, recipe_id=recipe_id,
+                       author_id=author_id, pub_date=pub_date)
+             for user_id in subscribers for recipe_id, pub_date in recipes),
+            batch_size=settings.FEED_FANOUT_BATCH_SIZE,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0014_counters'),
+        ('users', '0002_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField(verbose_name='Дата публикации рецепта')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to='recipes.recipe', verbose_name='Рецепт')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to=settings.AUTH_USER_MODEL, verbose_name='Подписчик')),
+            ],
+            options={
+                'verbose_name': 'Запись ленты',
+                'verbose_name_plural': 'Записи лент',
+                'indexes': [models.Index(fields=['user', '-pub_date', '-recipe'], name='feed_entry_user_date_idx'), models.Index(fields=['user', 'author'], name='feed_entry_user_author_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='feedentry',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='feed_entry_unique'),
+        ),
+        migrations.RunPython(fill_feeds, migrations.RunPython.noop),
+    ]
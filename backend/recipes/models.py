@@ -1,11 +1,53 @@
-from hashlib import shake_128
-from random import randint
+from hashlib import md5
+from itertools import islice
 
 from django.conf import settings
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models.functions import RowNumber
+from django.utils import timezone
 
-from users.models import User
+from users.counters import CounterFieldsMixin, change_counter
+from users.models import Subscribe, User
+from .search import search_recipes
+from .short_links import encode_short_link
+
+
+class CatalogVersionQuerySet(models.QuerySet):
+    def bump(self, name):
+        updated = self.filter(name=name).update(
+            version=models.F('version') + 1, updated_at=timezone.now())
+        if not updated:
+            self.get_or_create(name=name, defaults={'version': 1})
+
+    def current(self, name):
+        """Текущая версия справочника, 0 - если ее еще нет."""
+        return self.filter(name=name).values_list(
+            'version', flat=True).first() or 0
+
+
+class CatalogVersion(models.Model):
+    """Модель версии справочника, растет при каждом изменении."""
+
+    TAGS = 'tags'
+    INGREDIENTS = 'ingredients'
+    COMPOSITION = 'composition'
+
+    name = models.CharField('Справочник', max_length=32, unique=True)
+    version = models.PositiveBigIntegerField('Версия', default=0)
+    checksum = models.CharField(
+        'Контрольная сумма источника', max_length=64, blank=True)
+    updated_at = models.DateTimeField('Дата изменения', auto_now=True)
+
+    objects = CatalogVersionQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Версия справочника'
+        verbose_name_plural = 'Версии справочников'
+
+    def __str__(self):
+        return f'{self.name} v{self.version}'
 
 
 class Ingredient(models.Model):
@@ -58,7 +100,72 @@ class Tag(models.Model):
         return self.slug
 
 
+def recipe_prefetches():
+    """Связи, которые нужны для вывода полного рецепта."""
+    return (
+        'tags',
+        models.Prefetch(
+            'recipe_ingredients',
+            queryset=RecipeIngredients.objects.select_related(
+                'ingredient').order_by('ingredient__name')
+        ),
+    )
+
+
 class RecipeQuerySet(models.QuerySet):
+    def with_related(self):
+        return self.select_related('author').prefetch_related(
+            *recipe_prefetches())
+
+    def latest_by_author(self, author_ids, limit=None):
+        """Последние рецепты авторов одним запросом: {author_id: [...]}."""
+        recipes = self.filter(author_id__in=author_ids).defer('text')
+        features = connections[self.db].features
+        if limit is not None and features.supports_over_clause:
+            recipes = recipes.annotate(
+                row_number=models.Window(
+                    RowNumber(),
+                    partition_by=models.F('author_id'),
+                    order_by=(models.F('pub_date').desc(),
+                              models.F('id').desc()),
+                )
+            ).filter(row_number__lte=limit)
+        grouped = {author_id: [] for author_id in author_ids}
+        for recipe in recipes.order_by('-pub_date', '-id'):
+            author_recipes = grouped[recipe.author_id]
+            if limit is None or len(author_recipes) < limit:
+                author_recipes.append(recipe)
+        return grouped
+
+    def search(self, query):
+        return search_recipes(self, query)
+
+    def with_ingredient_matches(self, matches):
+        """
+        Оставляет рецепты из тройек (id, совпало, не хватает) и
+        сортирует их по числу совпавших, затем недостающих ингредиентов.
+        """
+        if not matches:
+            return self.none()
+        by_matched, by_missing = {}, {}
+        for recipe_id, matched, missing in matches:
+            by_matched.setdefault(matched, []).append(recipe_id)
+            by_missing.setdefault(missing, []).append(recipe_id)
+        return self.filter(
+            id__in=[recipe_id for recipe_id, _, _ in matches]
+        ).annotate(
+            ingredient_matches=models.Case(
+                *(models.When(id__in=ids, then=models.Value(matched))
+                  for matched, ids in by_matched.items()),
+                output_field=models.IntegerField(),
+            ),
+            ingredients_missing=models.Case(
+                *(models.When(id__in=ids, then=models.Value(missing))
+                  for missing, ids in by_missing.items()),
+                output_field=models.IntegerField(),
+            ),
+        ).order_by('-ingredient_matches', 'ingredients_missing', '-id')
+
     def annotate_user_recipe(self, user):
         return self.annotate(
             is_favorited=models.Exists(user.favorites.filter(
@@ -68,7 +175,7 @@ class RecipeQuerySet(models.QuerySet):
         )
 
 
-class Recipe(models.Model):
+class Recipe(CounterFieldsMixin, models.Model):
     """Модель рецепта."""
 
     name = models.CharField(
@@ -80,6 +187,10 @@ class Recipe(models.Model):
         'Дата публикации',
         auto_now_add=True
     )
+    updated_at = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True
+    )
     text = models.TextField(
         'Описание',
         help_text='Опишите процесс приготовления блюда',
@@ -93,6 +204,10 @@ class Recipe(models.Model):
         'Изображение',
         upload_to='recipes/images/',
     )
+    image_renditions = models.JSONField(
+        'Копии изображения', default=dict, blank=True, editable=False,
+        help_text='Пути к уменьшенным копиям изображения по их названиям',
+    )
     cooking_time = models.PositiveIntegerField(
         'Время приготовления (в минутах)',
         validators=[
@@ -115,10 +230,21 @@ class Recipe(models.Model):
     )
     short_link = models.CharField(
         'Сокращенная ссылка', max_length=16, unique=True,
+        null=True, blank=True,
+        help_text='Заполнено только у рецептов со ссылками старого формата',
+    )
+    favorites_count = models.PositiveIntegerField(
+        'В избранном', default=0, editable=False)
+    carts_count = models.PositiveIntegerField(
+        'В списках покупок', default=0, editable=False)
+    search_vector = SearchVectorField(
+        'Поисковый вектор', null=True, editable=False,
     )
 
     objects = RecipeQuerySet.as_manager()
 
+    counter_fields = ('favorites_count', 'carts_count')
+
     class Meta:
         ordering = ('-pub_date',)
         verbose_name = 'Рецепт'
@@ -127,17 +253,9 @@ class Recipe(models.Model):
     def __str__(self):
         return self.name
 
-    def generate_unique_short_id(self, text):
-        short_link = shake_128(text.encode('utf-8')).hexdigest(2)
-        if Recipe.objects.filter(short_link=short_link).exists():
-            shift = randint(0, 9)
-            return self.generate_unique_short_id(text + str(shift))
-        return short_link
-
-    def save(self, *args, **kwargs):
-        if not self.short_link:
-            self.short_link = self.generate_unique_short_id(self.text)
-        super().save(*args, **kwargs)
+    @property
+    def short_code(self):
+        return self.short_link or encode_short_link(self.pk)
 
 
 class RecipeIngredients(models.Model):
@@ -146,6 +264,7 @@ class RecipeIngredients(models.Model):
     recipe = models.ForeignKey(
         Recipe,
         on_delete=models.CASCADE,
+        related_name='recipe_ingredients',
         verbose_name='Рецепт',)
     ingredient = models.ForeignKey(
         Ingredient,
@@ -169,6 +288,118 @@ class RecipeIngredients(models.Model):
         return f'{self.ingredient} - {self.amount}'
 
 
+class RecipeSimilarity(models.Model):
+    """Модель похожего рецепта, заполняется расчетом по составу."""
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similarities',
+        verbose_name='Рецепт',
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Похожий рецепт',
+    )
+    score = models.FloatField('Сходство')
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('recipe', 'similar'),
+                name='recipe_similarity_unique'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=('recipe', '-score'),
+                name='recipe_similarity_score_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} - {self.similar}'
+
+
+class RecipeUserQuerySet(models.QuerySet):
+    def execute_returning(self, sql, params):
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(sql, params)
+            return [row[0] for row in cursor.fetchall()]
+
+    def add_recipes(self, user_id, recipe_ids):
+        """
+        Добавляет рецепты пользователю одним INSERT ... ON CONFLICT.
+
+        Возвращает id только что добавленных рецептов: уже добавленные
+        и несуществующие рецепты в результат не попадают.
+        """
+        recipe_ids = sorted({int(recipe_id) for recipe_id in recipe_ids})
+        if not recipe_ids:
+            return []
+        quote = connections[self.db].ops.quote_name
+        placeholders = ', '.join(['%s'] * len(recipe_ids))
+        with transaction.atomic(using=self.db):
+            added = self.execute_returning(
+                f'INSERT INTO {quote(self.model._meta.db_table)} '
+                f'(user_id, recipe_id) '
+                f'SELECT %s, id FROM {quote(Recipe._meta.db_table)} '
+                f'WHERE id IN ({placeholders}) '
+                f'ON CONFLICT (user_id, recipe_id) DO NOTHING '
+                f'RETURNING recipe_id',
+                [user_id, *recipe_ids],
+            )
+            if added:
+                self.recipes_added(user_id, added)
+        return added
+
+    def remove_recipes(self, user_id, recipe_ids):
+        """Удаляет рецепты пользователя и возвращает id удаленных."""
+        recipe_ids = sorted({int(recipe_id) for recipe_id in recipe_ids})
+        if not recipe_ids:
+            return []
+        quote = connections[self.db].ops.quote_name
+        placeholders = ', '.join(['%s'] * len(recipe_ids))
+        with transaction.atomic(using=self.db):
+            removed = self.execute_returning(
+                f'DELETE FROM {quote(self.model._meta.db_table)} '
+                f'WHERE user_id = %s AND recipe_id IN ({placeholders}) '
+                f'RETURNING recipe_id',
+                [user_id, *recipe_ids],
+            )
+            if removed:
+                self.recipes_removed(user_id, removed)
+        return removed
+
+    def recipes_added(self, user_id, recipe_ids):
+        """Вызывается после добавления, сигналы моделей при этом не шлются."""
+        change_counter(
+            Recipe.objects.using(self.db).filter(id__in=recipe_ids),
+            self.model.counter_field, 1)
+
+    def recipes_removed(self, user_id, recipe_ids):
+        """Вызывается после удаления, сигналы моделей при этом не шлются."""
+        change_counter(
+            Recipe.objects.using(self.db).filter(id__in=recipe_ids),
+            self.model.counter_field, -1)
+
+
+class ShoppingCartQuerySet(RecipeUserQuerySet):
+    def recipes_added(self, user_id, recipe_ids):
+        super().recipes_added(user_id, recipe_ids)
+        ShoppingCartIngredient.objects.using(self.db).add_recipes(
+            user_id, recipe_ids)
+
+    def recipes_removed(self, user_id, recipe_ids):
+        super().recipes_removed(user_id, recipe_ids)
+        ShoppingCartIngredient.objects.using(self.db).add_recipes(
+            user_id, recipe_ids, sign=-1)
+
+
 class RecipeUserModel(models.Model):
     """Абстрактная модель связи пользователь-рецепт."""
 
@@ -183,8 +414,16 @@ class RecipeUserModel(models.Model):
         verbose_name='Пользователь',
     )
 
+    objects = RecipeUserQuerySet.as_manager()
+
     class Meta:
         abstract = True
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='%(class)s_unique_user_recipe',
+            )
+        ]
 
     def __str__(self):
         return f'{self.recipe} добавлен к пользователю {self.user}'
@@ -193,6 +432,8 @@ class RecipeUserModel(models.Model):
 class FavoriteRecipe(RecipeUserModel):
     """Модель избранных рецептов."""
 
+    counter_field = 'favorites_count'
+
     class Meta(RecipeUserModel.Meta):
         default_related_name = 'favorites'
         verbose_name = 'Избранное'
@@ -202,7 +443,268 @@ class FavoriteRecipe(RecipeUserModel):
 class ShoppingCart(RecipeUserModel):
     """Модель рецептов в корзине."""
 
+    counter_field = 'carts_count'
+    objects = ShoppingCartQuerySet.as_manager()
+
     class Meta(RecipeUserModel.Meta):
         default_related_name = 'carts'
         verbose_name = 'Список покупок'
         verbose_name_plural = 'Список покупок'
+
+
+class ShoppingCartIngredientQuerySet(models.QuerySet):
+    def add_amounts(self, deltas):
+        """Применяет изменения количеств {(user_id, ingredient_id): delta}."""
+        deltas = {key: delta for key, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        user_ids = sorted({user_id for user_id, _ in deltas})
+        ingredient_ids = {ingredient_id for _, ingredient_id in deltas}
+        with transaction.atomic(using=self.db):
+            list(User.objects.using(self.db).select_for_update().filter(
+                id__in=user_ids).order_by('id').values_list('id'))
+            existing = {
+                (item.user_id, item.ingredient_id): item
+                for item in self.filter(
+                    user_id__in=user_ids, ingredient_id__in=ingredient_ids)
+            }
+            to_create, to_update, to_delete = [], [], []
+            for (user_id, ingredient_id), delta in deltas.items():
+                item = existing.get((user_id, ingredient_id))
+                if item is None:
+                    if delta > 0:
+                        to_create.append(self.model(
+                            user_id=user_id,
+                            ingredient_id=ingredient_id,
+                            amount=delta,
+                        ))
+                    continue
+                item.amount += delta
+                if item.amount > 0:
+                    to_update.append(item)
+                else:
+                    to_delete.append(item.id)
+            self.bulk_create(to_create)
+            self.bulk_update(to_update, ('amount',))
+            self.filter(id__in=to_delete).delete()
+
+    def add_recipes(self, user_id, recipe_ids, sign=1):
+        self.add_amounts({
+            (user_id, ingredient_id): sign * amount
+            for ingredient_id, amount in RecipeIngredients.objects.filter(
+                recipe_id__in=recipe_ids
+            ).values('ingredient_id').annotate(
+                total=models.Sum('amount')
+            ).values_list('ingredient_id', 'total').order_by()
+        })
+
+    def add_recipe(self, user_id, recipe_id, sign=1):
+        self.add_recipes(user_id, (recipe_id,), sign)
+
+    def remove_recipe(self, user_id, recipe_id):
+        self.add_recipe(user_id, recipe_id, sign=-1)
+
+    def change_recipe(self, recipe_id, old_amounts, new_amounts):
+        """Переносит изменение состава рецепта в корзины пользователей."""
+        changes = {
+            ingredient_id: (new_amounts.get(ingredient_id, 0)
+                            - old_amounts.get(ingredient_id, 0))
+            for ingredient_id in old_amounts.keys() | new_amounts.keys()
+        }
+        if not any(changes.values()):
+            return
+        carts = ShoppingCart.objects.filter(recipe_id=recipe_id).values(
+            'user_id').annotate(count=models.Count('id'))
+        self.add_amounts({
+            (cart['user_id'], ingredient_id): cart['count'] * change
+            for cart in carts
+            for ingredient_id, change in changes.items()
+        })
+
+    def expected_amounts(self, user_ids=None):
+        """Количества, посчитанные заново по рецептам в корзинах."""
+        rows = RecipeIngredients.objects.filter(recipe__carts__isnull=False)
+        if user_ids is not None:
+            rows = rows.filter(recipe__carts__user_id__in=user_ids)
+        rows = rows.values(
+            'recipe__carts__user_id', 'ingredient_id'
+        ).annotate(total=models.Sum('amount')).order_by()
+        return {
+            (row['recipe__carts__user_id'], row['ingredient_id']):
+                row['total']
+            for row in rows
+        }
+
+    def digest(self):
+        """Отпечаток содержимого корзины, None для пустой корзины."""
+        digest = md5(usedforsecurity=False)
+        empty = True
+        for ingredient_id, amount in self.values_list(
+            'ingredient_id', 'amount'
+        ).order_by('ingredient_id').iterator():
+            digest.update(f'{ingredient_id}:{amount};'.encode())
+            empty = False
+        return None if empty else digest.hexdigest()
+
+    def stored_amounts(self):
+        return {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount in self.values_list(
+                'user_id', 'ingredient_id', 'amount')
+        }
+
+
+class ShoppingCartIngredient(models.Model):
+    """Модель суммарного количества ингредиента в корзине пользователя."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='cart_ingredients',
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='cart_ingredients',
+        verbose_name='Ингредиент',
+    )
+    amount = models.PositiveBigIntegerField('Количество')
+
+    objects = ShoppingCartIngredientQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Ингредиент в списке покупок'
+        verbose_name_plural = 'Ингредиенты в списках покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='cart_ingredient_unique'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.ingredient} - {self.amount}'
+
+
+class FeedEntryQuerySet(models.QuerySet):
+    def fanout_authors(self, author_ids):
+        """Авторы, рецепты которых раскладываются по лентам при записи."""
+        return User.objects.using(self.db).filter(
+            id__in=author_ids,
+            subscribers_count__lte=settings.FEED_FANOUT_MAX_SUBSCRIBERS,
+        )
+
+    def merged_authors(self, user):
+        """Популярные авторы подписок, их рецепты добавляются при чтении."""
+        return User.objects.using(self.db).filter(
+            subscribing__user=user,
+            subscribers_count__gt=settings.FEED_FANOUT_MAX_SUBSCRIBERS,
+        )
+
+    def fan_out(self, recipes):
+        """Добавляет рецепты в ленты подписчиков их авторов."""
+        by_author = {}
+        for recipe in recipes:
+            by_author.setdefault(recipe.author_id, []).append(recipe)
+        subscriptions = Subscribe.objects.using(self.db).filter(
+            author__in=self.fanout_authors(by_author)
+        ).values_list('user_id', 'author_id')
+        entries = (
+            self.model(user_id=user_id, recipe_id=recipe.id,
+                       author_id=author_id, pub_date=recipe.pub_date)
+            for user_id, author_id in subscriptions.iterator()
+            for recipe in by_author[author_id]
+        )
+        batch_size = settings.FEED_FANOUT_BATCH_SIZE
+        while batch := list(islice(entries, batch_size)):
+            self.bulk_create(batch, ignore_conflicts=True)
+
+    def latest_recipes(self, author_id):
+        """Последние рецепты автора, если они раскладываются по лентам."""
+        return Recipe.objects.using(self.db).filter(
+            author__in=self.fanout_authors((author_id,))
+        ).order_by('-pub_date', '-id').values_list(
+            'id', 'pub_date')[:settings.FEED_BACKFILL_SIZE]
+
+    def backfill(self, user_id, author_id):
+        """Добавляет в ленту подписчика последние рецепты автора."""
+        self.bulk_create(
+            (self.model(user_id=user_id, recipe_id=recipe_id,
+                        author_id=author_id, pub_date=pub_date)
+             for recipe_id, pub_date in self.latest_recipes(author_id)),
+            ignore_conflicts=True,
+        )
+
+    def backfill_subscribers(self, author_id):
+        """
+        Добавляет последние рецепты автора в ленты всех его подписчиков.
+
+        Нужно, когда автор снова становится непопулярным: рецепты,
+        опубликованные без раскладки, перестают добавляться при чтении.
+        """
+        recipes = list(self.latest_recipes(author_id))
+        subscribers = Subscribe.objects.using(self.db).filter(
+            author_id=author_id).values_list('user_id', flat=True)
+        entries = (
+            self.model(user_id=user_id, recipe_id=recipe_id,
+                       author_id=author_id, pub_date=pub_date)
+            for user_id in subscribers.iterator()
+            for recipe_id, pub_date in recipes
+        )
+        batch_size = settings.FEED_FANOUT_BATCH_SIZE
+        while batch := list(islice(entries, batch_size)):
+            self.bulk_create(batch, ignore_conflicts=True)
+
+    def trim(self, user_id, author_id):
+        """Убирает из ленты подписчика рецепты автора."""
+        return self.filter(user_id=user_id, author_id=author_id).delete()
+
+
+class FeedEntry(models.Model):
+    """Модель записи ленты подписок, заполняется при публикации рецепта."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Подписчик',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Рецепт',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор',
+    )
+    pub_date = models.DateTimeField('Дата публикации рецепта')
+
+    objects = FeedEntryQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи лент'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='feed_entry_unique'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=('user', '-pub_date', '-recipe'),
+                name='feed_entry_user_date_idx'
+            ),
+            models.Index(
+                fields=('user', 'author'),
+                name='feed_entry_user_author_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.user} - {self.recipe}'
@@ -0,0 +1,60 @@
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+
+def rendition_name(recipe_id, name, key, image_format):
+    """Путь копии; id рецепта в нем, потому что оригинал бывает общим."""
+    stem = os.path.splitext(os.path.basename(name))[0]
+    extension = 'jpg' if image_format == 'JPEG' else image_format.lower()
+    return (f'{settings.IMAGE_RENDITIONS_PATH}'
+            f'{recipe_id}_{stem}_{key}.{extension}')
+
+
+def render(image, size, image_format, quality):
+    """Уменьшает изображение до размера и кодирует в нужный формат."""
+    image = image.copy()
+    image.thumbnail(size, Image.LANCZOS)
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    buffer = BytesIO()
+    image.save(buffer, image_format, quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+def make_renditions(recipe_id, name):
+    """
+    Создает уменьшенные копии изображения из хранилища.
+
+    Принимает и возвращает только строки, поэтому подходит
+    для запуска в отдельном процессе.
+    """
+    with default_storage.open(name) as file:
+        image = ImageOps.exif_transpose(Image.open(file))
+        image.load()
+    renditions = {}
+    for key, spec in settings.IMAGE_RENDITIONS.items():
+        path = rendition_name(recipe_id, name, key, spec['format'])
+        if default_storage.exists(path):
+            default_storage.delete(path)
+        renditions[key] = default_storage.save(path, ContentFile(render(
+            image, spec['size'], spec['format'], spec['quality'])))
+    return renditions
+
+
+def delete_renditions(renditions, keep=()):
+    for path in set(renditions.values()).difference(keep):
+        default_storage.delete(path)
+
+
+def update_renditions(recipe):
+    """Пересоздает копии изображения рецепта и сохраняет пути к ним."""
+    previous = recipe.image_renditions
+    recipe.image_renditions = make_renditions(recipe.id, recipe.image.name)
+    # updated_at входит в ETag рецепта, без него клиенты получат 304.
+    recipe.save(update_fields=('image_renditions', 'updated_at'))
+    delete_renditions(previous, keep=recipe.image_renditions.values())
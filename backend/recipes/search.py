@@ -0,0 +1,76 @@
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import F
+from django.db.models.expressions import RawSQL
+
+SEARCH_CONFIG = 'russian'
+FTS_TABLE = 'recipes_recipe_fts'
+FTS_NAME_WEIGHT = 10.0
+FTS_TEXT_WEIGHT = 1.0
+
+
+def fts_match_expression(query):
+    """Запрос FTS5: все слова запроса как префиксы, через И."""
+    return ' '.join(
+        f'"{word}"*' for word in re.findall(r'\w+', query.casefold()))
+
+
+def search_recipes(queryset, query):
+    """Фильтрует рецепты по запросу и сортирует по релевантности."""
+    vendor = connections[queryset.db].vendor
+    if vendor == 'postgresql':
+        search_query = SearchQuery(
+            query, config=SEARCH_CONFIG, search_type='websearch')
+        return queryset.filter(search_vector=search_query).annotate(
+            rank=SearchRank(F('search_vector'), search_query)
+        ).order_by('-rank', '-pub_date', '-id')
+    if vendor == 'sqlite':
+        match = fts_match_expression(query)
+        if not match:
+            return queryset.none()
+        return queryset.filter(
+            id__in=RawSQL(
+                f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+                (match,)
+            )
+        ).annotate(
+            rank=RawSQL(
+                f'SELECT -bm25({FTS_TABLE}, {FTS_NAME_WEIGHT}, '
+                f'{FTS_TEXT_WEIGHT}) FROM {FTS_TABLE} '
+                f'WHERE {FTS_TABLE} MATCH %s '
+                f'AND rowid = recipes_recipe.id',
+                (match,)
+            )
+        ).order_by('-rank', '-pub_date', '-id')
+    return queryset.filter(name__icontains=query)
+
+
+def update_search_index(recipes, using='default'):
+    """Обновляет FTS5-индекс SQLite, в PostgreSQL вектор ведет триггер."""
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    rows = [(recipe.id, recipe.name, recipe.text) for recipe in recipes]
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+            [(row[0],) for row in rows]
+        )
+        cursor.executemany(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, text) '
+            f'VALUES (%s, %s, %s)',
+            rows
+        )
+
+
+def remove_from_search_index(recipe_ids, using='default'):
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+            [(recipe_id,) for recipe_id in recipe_ids]
+        )
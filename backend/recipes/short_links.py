@@ -0,0 +1,51 @@
+from string import ascii_letters, digits
+
+ALPHABET = digits + ascii_letters
+BASE = len(ALPHABET)
+CODE_LENGTH = 6
+CODE_SPACE = BASE ** CODE_LENGTH
+# Множитель взаимно прост с 62, поэтому перестановка кодов обратима.
+MULTIPLIER = 1_580_030_173
+INVERSE = pow(MULTIPLIER, -1, CODE_SPACE)
+OFFSET = 11_881_376
+
+
+def to_base62(value):
+    code = ''
+    while value:
+        value, remainder = divmod(value, BASE)
+        code = ALPHABET[remainder] + code
+    return code or ALPHABET[0]
+
+
+def from_base62(code):
+    value = 0
+    for char in code:
+        value = value * BASE + ALPHABET.index(char)
+    return value
+
+
+def encode_short_link(recipe_id):
+    """Код короткой ссылки по id рецепта без обращений к базе.
+
+    Для id меньше 62**6 код из шести символов получается обратимой
+    перестановкой, дальше используется запись id в base62. Старые
+    ссылки из четырех символов с новыми кодами не пересекаются.
+    """
+    if recipe_id < CODE_SPACE:
+        return to_base62(
+            (recipe_id * MULTIPLIER + OFFSET) % CODE_SPACE
+        ).rjust(CODE_LENGTH, ALPHABET[0])
+    return to_base62(recipe_id)
+
+
+def decode_short_link(code):
+    """id рецепта по коду или None, если код не выдавался алгоритмом."""
+    if len(code) < CODE_LENGTH or any(char not in ALPHABET for char in code):
+        return None
+    value = from_base62(code)
+    if len(code) == CODE_LENGTH:
+        return (value - OFFSET) * INVERSE % CODE_SPACE
+    if encode_short_link(value) != code:
+        return None
+    return value
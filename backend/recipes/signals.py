@@ -0,0 +1,132 @@
+from collections import Counter
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import Signal, receiver
+
+from .composition_index import composition_index
+from .links import forget_recipe
+from .models import (CatalogVersion, FavoriteRecipe, FeedEntry, Ingredient,
+                     Recipe, RecipeIngredients, ShoppingCart,
+                     ShoppingCartIngredient, Tag)
+from .search import remove_from_search_index, update_search_index
+from .tasks import backfill_author_feeds
+from users.counters import change_counter
+from users.models import Subscribe, User
+
+# Рассылается после загрузки пакета рецептов в обход сигналов моделей.
+recipes_imported = Signal()
+
+# Рассылается после массового обновления копий изображений рецептов.
+renditions_updated = Signal()
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_recipe_to_cart_ingredients(sender, instance, created, **kwargs):
+    if created:
+        ShoppingCartIngredient.objects.add_recipe(
+            instance.user_id, instance.recipe_id)
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def remove_recipe_from_cart_ingredients(sender, instance, **kwargs):
+    ShoppingCartIngredient.objects.remove_recipe(
+        instance.user_id, instance.recipe_id)
+
+
+@receiver(post_save, sender=FavoriteRecipe)
+@receiver(post_save, sender=ShoppingCart)
+def recipe_user_added(sender, instance, created, using, **kwargs):
+    if created:
+        change_counter(
+            Recipe.objects.using(using).filter(id=instance.recipe_id),
+            sender.counter_field, 1)
+
+
+@receiver(post_delete, sender=FavoriteRecipe)
+@receiver(post_delete, sender=ShoppingCart)
+def recipe_user_removed(sender, instance, using, **kwargs):
+    change_counter(
+        Recipe.objects.using(using).filter(id=instance.recipe_id),
+        sender.counter_field, -1)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredient_changed(sender, **kwargs):
+    CatalogVersion.objects.bump(CatalogVersion.INGREDIENTS)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def bump_tags_version(sender, **kwargs):
+    CatalogVersion.objects.bump(CatalogVersion.TAGS)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, created, using, update_fields=None,
+                 **kwargs):
+    update_search_index((instance,), using=using)
+    # Частичные сохранения состав не меняют: изменение набора
+    # ингредиентов отмечает RecipeWriteSerializer.
+    if created or update_fields is None:
+        composition_index.recipes_changed((instance.id,))
+    if created:
+        forget_recipe(instance)
+        change_counter(
+            User.objects.using(using).filter(id=instance.author_id),
+            'recipes_count', 1)
+        FeedEntry.objects.using(using).fan_out((instance,))
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, using, **kwargs):
+    remove_from_search_index((instance.id,), using=using)
+    composition_index.recipes_changed((instance.id,))
+    forget_recipe(instance)
+    change_counter(
+        User.objects.using(using).filter(id=instance.author_id),
+        'recipes_count', -1)
+
+
+@receiver(recipes_imported)
+def count_imported_recipes(sender, recipes, **kwargs):
+    authors = Counter(recipe.author_id for recipe in recipes)
+    for author_id, count in authors.items():
+        change_counter(
+            User.objects.filter(id=author_id), 'recipes_count', count)
+
+
+@receiver(recipes_imported)
+def fan_out_imported_recipes(sender, recipes, **kwargs):
+    FeedEntry.objects.fan_out(recipes)
+
+
+@receiver(recipes_imported)
+def index_imported_recipes(sender, recipes, **kwargs):
+    composition_index.recipes_changed(recipe.id for recipe in recipes)
+
+
+@receiver(post_save, sender=RecipeIngredients)
+@receiver(post_delete, sender=RecipeIngredients)
+def recipe_ingredients_changed(sender, instance, **kwargs):
+    composition_index.recipes_changed((instance.recipe_id,))
+
+
+@receiver(post_save, sender=Subscribe)
+def backfill_feed(sender, instance, created, using, **kwargs):
+    if created:
+        FeedEntry.objects.using(using).backfill(
+            instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Subscribe)
+def trim_feed(sender, instance, using, **kwargs):
+    FeedEntry.objects.using(using).trim(instance.user_id, instance.author_id)
+    # Счетчик уже уменьшен в users.signals. Если автор только что
+    # опустился до порога, его рецепты больше не добавляются при чтении.
+    if User.objects.using(using).filter(
+        id=instance.author_id,
+        subscribers_count=settings.FEED_FANOUT_MAX_SUBSCRIBERS,
+    ).exists():
+        backfill_author_feeds.enqueue((instance.author_id,))
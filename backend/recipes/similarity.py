@@ -0,0 +1,153 @@
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from scipy import sparse
+
+from .models import Recipe, RecipeIngredients, RecipeSimilarity
+
+
+def load_pairs(queryset, *fields):
+    return np.fromiter(
+        (value for row in queryset.values_list(*fields).iterator()
+         for value in row),
+        dtype=np.int64,
+    ).reshape(-1, 2)
+
+
+def incidence_matrix(pairs, recipe_ids):
+    """Бинарная разреженная матрица рецепт×объект по парам (рецепт, id)."""
+    pairs = pairs[np.isin(pairs[:, 0], recipe_ids)]
+    columns, column_index = np.unique(pairs[:, 1], return_inverse=True)
+    return sparse.csr_matrix(
+        (np.ones(len(pairs)),
+         (np.searchsorted(recipe_ids, pairs[:, 0]), column_index)),
+        shape=(len(recipe_ids), len(columns)),
+    )
+
+
+def jaccard(matrix, start, stop):
+    """Коэффициенты Жаккара строк start:stop со всеми строками матрицы."""
+    sizes = np.asarray(matrix.sum(axis=1)).ravel()
+    common = (matrix[start:stop] @ matrix.T).tocoo()
+    union = sizes[common.row + start] + sizes[common.col] - common.data
+    return common.row, common.col, common.data / union
+
+
+def score_rows(ingredients, tags, start, stop):
+    """
+    Сходство рецептов start:stop с остальными.
+
+    Основа - коэффициент Жаккара по ингредиентам, совпадение тегов
+    добавляет к нему SIMILAR_RECIPES_TAG_BONUS, умноженный на
+    коэффициент Жаккара по тегам. Рецепты без общих ингредиентов
+    похожими не считаются.
+    """
+    rows, columns, scores = jaccard(ingredients, start, stop)
+    tag_rows, tag_columns, tag_scores = jaccard(tags, start, stop)
+    bonus = sparse.csr_matrix(
+        (tag_scores, (tag_rows, tag_columns)),
+        shape=(stop - start, tags.shape[0]),
+    )[rows, columns]
+    scores = scores + settings.SIMILAR_RECIPES_TAG_BONUS * np.asarray(
+        bonus).ravel()
+    keep = rows + start != columns
+    return rows[keep] + start, columns[keep], scores[keep]
+
+
+def top_k(rows, columns, scores, k):
+    """Оставляет в каждой строке k пар с наибольшим сходством."""
+    order = np.lexsort((columns, -scores, rows))
+    rows, columns, scores = rows[order], columns[order], scores[order]
+    rank = np.arange(len(rows)) - np.searchsorted(rows, rows)
+    keep = rank < k
+    return rows[keep], columns[keep], scores[keep]
+
+
+def load_matrices(recipe_ids=None):
+    """Матрицы ингредиентов и тегов рецептов, по умолчанию всего каталога."""
+    ingredient_rows = RecipeIngredients.objects.all()
+    tag_rows = Recipe.tags.through.objects.all()
+    if recipe_ids is not None:
+        ingredient_rows = ingredient_rows.filter(recipe_id__in=recipe_ids)
+        tag_rows = tag_rows.filter(recipe_id__in=recipe_ids)
+    ingredient_pairs = load_pairs(ingredient_rows, 'recipe_id',
+                                  'ingredient_id')
+    recipe_ids = np.unique(ingredient_pairs[:, 0])
+    return (
+        recipe_ids,
+        incidence_matrix(ingredient_pairs, recipe_ids),
+        incidence_matrix(load_pairs(tag_rows, 'recipe_id', 'tag_id'),
+                         recipe_ids),
+    )
+
+
+def compute_similarities(k=None, chunk_size=None):
+    """
+    Считает похожие рецепты для всего каталога.
+
+    Строки матрицы обрабатываются блоками по chunk_size, поэтому
+    в памяти одновременно находится только часть попарных сходств.
+    """
+    k = k or settings.SIMILAR_RECIPES_TOP_K
+    chunk_size = chunk_size or settings.SIMILAR_RECIPES_CHUNK_SIZE
+    recipe_ids, ingredients, tags = load_matrices()
+    for start in range(0, len(recipe_ids), chunk_size):
+        stop = min(start + chunk_size, len(recipe_ids))
+        rows, columns, scores = top_k(
+            *score_rows(ingredients, tags, start, stop), k)
+        yield from (
+            RecipeSimilarity(recipe_id=recipe_id, similar_id=similar_id,
+                             score=score)
+            for recipe_id, similar_id, score in zip(
+                recipe_ids[rows].tolist(), recipe_ids[columns].tolist(),
+                scores.tolist())
+        )
+
+
+@transaction.atomic
+def refresh_similar_recipes(recipe_id, k=None):
+    """
+    Обновляет похожие рецепты после изменения состава рецепта.
+
+    Считаются только рецепты с общими ингредиентами: у самого рецепта
+    список пересчитывается полностью, в списки остальных он добавляется
+    или из них удаляется. Если рецепт выпал из чужого списка, освободившееся
+    место займет другой рецепт только после полного пересчета.
+    """
+    k = k or settings.SIMILAR_RECIPES_TOP_K
+    RecipeSimilarity.objects.filter(recipe_id=recipe_id).delete()
+    RecipeSimilarity.objects.filter(similar_id=recipe_id).delete()
+    candidates = RecipeIngredients.objects.filter(
+        ingredient__in=RecipeIngredients.objects.filter(
+            recipe_id=recipe_id).values('ingredient_id')
+    ).values('recipe_id')
+    recipe_ids, ingredients, tags = load_matrices(candidates)
+    index = np.searchsorted(recipe_ids, recipe_id)
+    if index == len(recipe_ids) or recipe_ids[index] != recipe_id:
+        return 0
+    _, columns, scores = score_rows(ingredients, tags, index, index + 1)
+    similar = dict(zip(recipe_ids[columns].tolist(), scores.tolist()))
+    entries = [
+        RecipeSimilarity(recipe_id=recipe_id, similar_id=similar_id,
+                         score=score)
+        for similar_id, score in sorted(
+            similar.items(), key=lambda item: (-item[1], item[0]))[:k]
+    ]
+    lists = {}
+    for entry_id, owner_id, score in RecipeSimilarity.objects.filter(
+        recipe_id__in=similar
+    ).values_list('id', 'recipe_id', 'score'):
+        lists.setdefault(owner_id, []).append((score, entry_id))
+    displaced = []
+    for owner_id, score in similar.items():
+        current = lists.get(owner_id, ())
+        if len(current) >= k:
+            lowest_score, lowest_id = min(current)
+            if score <= lowest_score:
+                continue
+            displaced.append(lowest_id)
+        entries.append(RecipeSimilarity(
+            recipe_id=owner_id, similar_id=recipe_id, score=score))
+    RecipeSimilarity.objects.filter(id__in=displaced).delete()
+    RecipeSimilarity.objects.bulk_create(entries)
+    return len(entries)
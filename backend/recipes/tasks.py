@@ -0,0 +1,23 @@
+from jobs.queue import task
+from .models import FeedEntry, Recipe
+from .renditions import update_renditions
+from .similarity import refresh_similar_recipes
+
+
+@task(priority=10)
+def make_recipe_renditions(recipe_id):
+    recipe = Recipe.objects.filter(id=recipe_id).first()
+    if recipe is None or not recipe.image:
+        return None
+    update_renditions(recipe)
+    return recipe.image_renditions
+
+
+@task
+def refresh_recipe_similarities(recipe_id):
+    return refresh_similar_recipes(recipe_id)
+
+
+@task
+def backfill_author_feeds(author_id):
+    FeedEntry.objects.backfill_subscribers(author_id)
@@ -1,14 +1,15 @@
 from django.conf import settings
-from django.http import HttpResponseRedirect
-from django.shortcuts import get_object_or_404
+from django.http import Http404, HttpResponseRedirect
 from django.views.decorators.http import require_http_methods
 
-from recipes.models import Recipe
+from recipes.links import resolve_short_link
 
 
 @require_http_methods(('GET',))
 def redirect_short_link(request, short_link):
-    recipe = get_object_or_404(Recipe, short_link=short_link)
+    recipe_id = resolve_short_link(short_link)
+    if recipe_id is None:
+        raise Http404
     return HttpResponseRedirect(redirect_to=request.build_absolute_uri(
-        settings.RECIPE_URL_PATTERN.format(recipe_id=recipe.id)
+        settings.RECIPE_URL_PATTERN.format(recipe_id=recipe_id)
     ))
@@ -16,10 +16,12 @@ class UserAdmin(BaseUserAdmin):
                     'id')
     search_fields = ('username', 'email')
 
-    @admin.display(description='Количество рецептов')
+    @admin.display(description='Количество рецептов',
+                   ordering='recipes_count')
     def get_recipes_count(self, obj):
-        return obj.recipes.count()
+        return obj.recipes_count
 
-    @admin.display(description='Количество подписчиков')
+    @admin.display(description='Количество подписчиков',
+                   ordering='subscribers_count')
     def get_subscribers_count(self, obj):
-        return obj.subscribing.count()
+        return obj.subscribers_count
@@ -0,0 +1,59 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+
+class CounterFieldsMixin:
+    """
+    Не дает полному save() перезаписать счетчики.
+
+    Счетчики меняются только через change_counter, поэтому в памяти
+    их значения могут быть устаревшими. save() без аргументов
+    у существующего объекта не включает counter_fields в UPDATE,
+    остальное поведение save() не меняется: отложенные поля
+    не сохраняются, а удаленная строка создается заново.
+    Явные update_fields и force_insert работают как обычно.
+    """
+
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (self._state.adding or args or kwargs.get('force_insert')
+                or kwargs.get('update_fields') is not None):
+            return super().save(*args, **kwargs)
+        self._keep_counters = True
+        try:
+            super().save(**kwargs)
+        finally:
+            del self._keep_counters
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields,
+                   forced_update):
+        if getattr(self, '_keep_counters', False):
+            values = [value for value in values
+                      if value[0].name not in self.counter_fields]
+        return super()._do_update(
+            base_qs, using, pk_val, values, update_fields, forced_update)
+
+
+def change_counter(queryset, field, delta):
+    """Атомарно сдвигает счетчик выражением F(), не опуская его ниже нуля."""
+    if delta:
+        queryset.update(**{field: Greatest(F(field) + delta, 0)})
+
+
+def count_subquery(queryset, field):
+    """Число строк queryset, у которых field совпадает с pk внешней модели."""
+    return Coalesce(Subquery(
+        queryset.filter(**{field: OuterRef('pk')}).order_by().values(
+            field).annotate(total=Count('pk')).values('total')[:1]
+    ), 0)
+
+
+def recount(queryset, field, actual):
+    """Исправляет расхождения счетчика с пересчитанным значением."""
+    drifted = queryset.annotate(actual=actual).exclude(
+        **{field: F('actual')}).values_list('pk', flat=True)
+    ids = list(drifted)
+    if ids:
+        queryset.filter(pk__in=ids).update(**{field: actual})
+    return len(ids)
@@ -2,10 +2,11 @@ from django.conf import settings
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 
+from .counters import CounterFieldsMixin
 from .validators import validate_username
 
 
-class User(AbstractUser):
+class User(CounterFieldsMixin, AbstractUser):
     '''Модель пользователя'''
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
@@ -35,6 +36,12 @@ class User(AbstractUser):
         upload_to='users/',
         blank=True,
     )
+    recipes_count = models.PositiveIntegerField(
+        'Количество рецептов', default=0, editable=False)
+    subscribers_count = models.PositiveIntegerField(
+        'Количество подписчиков', default=0, editable=False)
+
+    counter_fields = ('recipes_count', 'subscribers_count')
 
     class Meta:
         ordering = ('email', )
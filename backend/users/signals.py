@@ -0,0 +1,20 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .counters import change_counter
+from .models import Subscribe, User
+
+
+@receiver(post_save, sender=Subscribe)
+def subscription_created(sender, instance, created, using, **kwargs):
+    if created:
+        change_counter(
+            User.objects.using(using).filter(id=instance.author_id),
+            'subscribers_count', 1)
+
+
+@receiver(post_delete, sender=Subscribe)
+def subscription_deleted(sender, instance, using, **kwargs):
+    change_counter(
+        User.objects.using(using).filter(id=instance.author_id),
+        'subscribers_count', -1)
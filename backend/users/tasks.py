@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps
+
+from jobs.queue import task
+from recipes.renditions import render
+from .models import User
+
+
+@task(priority=10)
+def resize_avatar(user_id):
+    user = User.objects.filter(id=user_id).first()
+    if user is None or not user.avatar:
+        return None
+    name = user.avatar.name
+    with default_storage.open(name) as file:
+        source = Image.open(file)
+        image_format = source.format or 'PNG'
+        image = ImageOps.exif_transpose(source)
+        image.load()
+    size = (settings.AVATAR_SIZE, settings.AVATAR_SIZE)
+    if image.width <= size[0] and image.height <= size[1]:
+        return name
+    resized = default_storage.save(name, ContentFile(render(
+        image, size, image_format, settings.AVATAR_QUALITY)))
+    with transaction.atomic():
+        user = User.objects.select_for_update().get(id=user_id)
+        if user.avatar.name != name:
+            # Пока задача ждала в очереди, аватар успели сменить.
+            default_storage.delete(resized)
+            return None
+        user.avatar = resized
+        user.save(update_fields=('avatar',))
+    default_storage.delete(name)
+    return resized